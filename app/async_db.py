@@ -0,0 +1,27 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from app.database import async_url, create_async_db_engine
+from app.utils import DATABASE_URL
+import os
+
+# Async twin of the sync engine in app.utils, for routes that should not hold a
+# threadpool worker while they wait on the database (e.g. public booking/slots).
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", async_url(DATABASE_URL))
+
+async_engine = create_async_db_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+if async_engine.dialect.name == "sqlite":
+    # Let SQLAlchemy emit BEGIN itself (the driver's implicit transactions would start too late) so a
+    # session can ask for BEGIN IMMEDIATE via the sqlite_begin execution option and take the write lock up front
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _disable_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(async_engine.sync_engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql(f"BEGIN {conn.get_execution_options().get('sqlite_begin', 'DEFERRED')}")
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,90 @@
+from sqlalchemy import select, insert, func, literal, exists, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.meeting import Meeting
+from app.feeds import bump_feed_version, bump_user_feed_version
+import asyncio
+import os
+import random
+
+# Retries when the database reports lock contention (SQLite: another writer held the lock past busy_timeout)
+BOOKING_MAX_ATTEMPTS = int(os.getenv("BOOKING_MAX_ATTEMPTS", 5))
+BOOKING_RETRY_BASE_SECONDS = float(os.getenv("BOOKING_RETRY_BASE_SECONDS", 0.01))
+
+class BookingRejected(Exception):
+    pass
+
+class BookingContention(Exception):
+    # Still contended after BOOKING_MAX_ATTEMPTS; the caller should answer 503
+    pass
+
+_MEETING_COLUMNS = (
+    "agenda_id", "start_time", "end_time", "booked_by_email", "meeting_type",
+    "travel_time_before", "travel_time_after", "virtual_app", "status",
+)
+
+def _conditional_insert(agenda_id: int, meeting, max_per_visitor: int):
+    # A single INSERT ... SELECT ... WHERE: the row is only written if nothing overlaps the slot and the
+    # visitor is under their limit, so there is no window between checking and inserting
+    overlapping = select(Meeting.id).where(
+        Meeting.agenda_id == agenda_id, Meeting.start_time < meeting.end_time, Meeting.end_time > meeting.start_time
+    )
+    visitor_bookings = select(func.count(Meeting.id)).where(
+        Meeting.agenda_id == agenda_id, Meeting.booked_by_email == meeting.booked_by_email
+    ).scalar_subquery()
+    values = select(
+        literal(agenda_id), literal(meeting.start_time), literal(meeting.end_time), literal(meeting.booked_by_email),
+        literal(meeting.meeting_type), literal(meeting.travel_time_before), literal(meeting.travel_time_after),
+        literal(meeting.virtual_app), literal("booked"),
+    ).where(~exists(overlapping), visitor_bookings < max_per_visitor)
+    return insert(Meeting).from_select(list(_MEETING_COLUMNS), values).returning(Meeting.id)
+
+async def _rejection_reason(db: AsyncSession, agenda_id: int, meeting, max_per_visitor: int) -> str:
+    # Only runs after the insert matched nothing, inside the same transaction
+    count = await db.scalar(select(func.count(Meeting.id)).where(
+        Meeting.agenda_id == agenda_id, Meeting.booked_by_email == meeting.booked_by_email
+    ))
+    if count >= max_per_visitor:
+        return "Booking limit reached for this agenda"
+    return "Slot already booked"
+
+async def run_locked(db: AsyncSession, agenda_ids, work):
+    # Runs `await work()` in a write transaction and commits it, retrying on lock contention. SQLite runs the
+    # transaction as BEGIN IMMEDIATE (see app.async_db), so concurrent writers queue on the write lock instead of
+    # failing at commit; PostgreSQL serialises writers per agenda with advisory locks, taken in id order so two
+    # transactions locking overlapping agendas cannot deadlock. Any exception from work() rolls back.
+    for attempt in range(BOOKING_MAX_ATTEMPTS):
+        try:
+            await db.commit()  # end any read transaction so the next one starts as a write transaction
+            await db.connection(execution_options={"sqlite_begin": "IMMEDIATE"})
+            if db.bind.dialect.name == "postgresql":
+                for key in sorted(set(agenda_ids)):
+                    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": key})
+            result = await work()
+            await db.commit()
+            return result
+        except OperationalError as e:
+            await db.rollback()
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            # Jittered exponential backoff keeps retrying writers from stampeding the lock together
+            await asyncio.sleep(random.uniform(0, BOOKING_RETRY_BASE_SECONDS * 2 ** attempt))
+        except BaseException:
+            await db.rollback()
+            raise
+    raise BookingContention()
+
+async def book_atomically(db: AsyncSession, agenda_id: int, meeting, max_per_visitor: int, before_commit=None) -> Meeting:
+    # before_commit(db, meeting) adds rows that must commit with the booking, e.g. the confirmation email
+    async def book():
+        meeting_id = await db.scalar(_conditional_insert(agenda_id, meeting, max_per_visitor))
+        if meeting_id is None:
+            raise BookingRejected(await _rejection_reason(db, agenda_id, meeting, max_per_visitor))
+        await db.execute(bump_feed_version(agenda_id))
+        await db.execute(bump_user_feed_version(agenda_id))
+        db_meeting = await db.get(Meeting, meeting_id)
+        if before_commit is not None:
+            before_commit(db, db_meeting)
+        return db_meeting
+
+    return await run_locked(db, [agenda_id], book)
@@ -0,0 +1,180 @@
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert
+from app.utils import SessionLocal
+import codecs
+import csv
+import io
+import orjson
+import os
+
+# Bulk import/export of NDJSON or CSV (header row + one record per line; quoted CSV fields may span lines).
+# Imports are validated with the regular Pydantic schemas and written BULK_CHUNK_SIZE rows per transaction.
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 1000))
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", 1000))
+BULK_MAX_RECORD_BYTES = int(os.getenv("BULK_MAX_RECORD_BYTES", 64 * 1024))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def bulk_format(request: Request, format: str = None) -> str:
+    # ?format= wins, then the Content-Type (imports) or Accept (exports) header; NDJSON by default
+    if format is None:
+        header = request.headers.get("content-type") or request.headers.get("accept") or ""
+        format = "csv" if "csv" in header else "ndjson"
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    return format
+
+async def _lines(request: Request):
+    # Yields (line number, raw bytes) as the body arrives, without buffering the whole upload.
+    # Decoding is left to the caller, so a line that is not UTF-8 fails on its own. A line that grows past
+    # BULK_MAX_RECORD_BYTES is handed on cut short (the caller rejects it) and the rest of it is skipped.
+    pending = bytearray()
+    line_no = 0
+    skipping = False
+    async for data in request.stream():
+        # Only the new data is searched: the pending tail is known to hold no line break
+        scan_from = len(pending)
+        pending += data
+        start = 0
+        while (end := pending.find(b"\n", scan_from)) != -1:
+            if skipping:
+                skipping = False
+            else:
+                line_no += 1
+                yield line_no, _strip_line(pending[start:end], line_no)
+            start = scan_from = end + 1
+        del pending[:start]
+        if skipping:
+            pending.clear()
+        elif len(pending) > BULK_MAX_RECORD_BYTES:
+            line_no += 1
+            yield line_no, bytes(pending)
+            pending.clear()
+            skipping = True
+    if pending and not skipping:
+        yield line_no + 1, _strip_line(pending, line_no + 1)
+
+def _strip_line(raw: bytearray, line_no: int) -> bytes:
+    return bytes(raw.removeprefix(codecs.BOM_UTF8) if line_no == 1 else raw).rstrip(b"\r")
+
+async def _csv_records(lines):
+    # Joins the lines of a record whose quoted field contains line breaks (RFC 4180): while the record has
+    # an odd number of quote characters a field is still open. Quotes are ASCII, so bytes can be counted.
+    # A record that grows past BULK_MAX_RECORD_BYTES is handed on as is and rejected by the caller.
+    first_line, parts, size, quotes = None, [], 0, 0
+    async for line_no, raw in lines:
+        if not parts:
+            first_line = line_no
+        parts.append(raw)
+        size += len(raw) + 1
+        quotes += raw.count(b'"')
+        if quotes % 2 == 0 or size > BULK_MAX_RECORD_BYTES:
+            yield first_line, b"\n".join(parts)
+            parts, size, quotes = [], 0, 0
+    if parts:
+        yield first_line, b"\n".join(parts)
+
+async def _records(request: Request, fmt: str):
+    # Yields (line number, dict) or (line number, error message); a CSV record is numbered by its first line
+    header = None
+    lines = _lines(request) if fmt == "ndjson" else _csv_records(_lines(request))
+    async for line_no, raw in lines:
+        if not raw.strip():
+            continue
+        try:
+            if len(raw) > BULK_MAX_RECORD_BYTES:
+                raise ValueError(f"record longer than {BULK_MAX_RECORD_BYTES} bytes")
+            line = raw.decode("utf-8")
+            if fmt == "ndjson":
+                record = orjson.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+            else:
+                values = next(csv.reader([line], strict=True))
+                if header is None:
+                    header = values
+                    continue
+                if len(values) != len(header):
+                    raise ValueError(f"expected {len(header)} columns, got {len(values)}")
+                # Empty CSV cells mean "not given", so schema defaults apply
+                record = {name: value for name, value in zip(header, values) if value != ""}
+        except (ValueError, csv.Error) as e:
+            # UnicodeDecodeError and orjson.JSONDecodeError are ValueErrors too
+            if fmt == "csv" and header is None:
+                # Without its header no row can be read; the next row must not be taken for it
+                raise HTTPException(status_code=400, detail=f"line {line_no}: unreadable CSV header: {e}")
+            yield line_no, str(e)
+            continue
+        yield line_no, record
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+
+async def import_records(request: Request, fmt: str, schema, to_row, write_chunk) -> dict:
+    # to_row(validated model) -> column dict; write_chunk(rows) inserts and commits one chunk
+    imported = 0
+    failed = 0
+    errors = []
+    chunk = []
+
+    def fail(line_no, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < BULK_MAX_ERRORS:
+            errors.append({"line": line_no, "error": message})
+
+    async for line_no, record in _records(request, fmt):
+        if isinstance(record, str):
+            fail(line_no, record)
+            continue
+        try:
+            chunk.append(to_row(schema(**record)))
+        except ValidationError as e:
+            fail(line_no, _validation_message(e))
+            continue
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            await write_chunk(chunk)
+            imported += len(chunk)
+            chunk = []
+    if chunk:
+        await write_chunk(chunk)
+        imported += len(chunk)
+    return {"imported": imported, "failed": failed, "errors": errors}
+
+def insert_chunk(db, model):
+    # executemany INSERT of one chunk in its own transaction
+    async def write_chunk(rows):
+        await db.execute(insert(model), rows)
+        await db.commit()
+    return write_chunk
+
+def export_response(query, columns, fmt: str, filename: str) -> StreamingResponse:
+    # Streams `query` (selecting `columns`, in order) in BULK_CHUNK_SIZE batches from a cursor of its own
+    def generate():
+        db = SessionLocal()
+        try:
+            result = db.execute(query.execution_options(yield_per=BULK_CHUNK_SIZE))
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator="\n")
+                writer.writerow(columns)
+                for rows in result.partitions():
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
+            else:
+                for rows in result.partitions():
+                    yield b"".join(orjson.dumps(dict(zip(columns, row)), default=str) + b"\n" for row in rows)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
@@ -0,0 +1,130 @@
+from sqlalchemy.orm import Session
+from app.models.agenda import Agenda
+from collections import OrderedDict, namedtuple
+import os
+import threading
+import time
+
+class TTLCache:
+    # Thread-safe LRU cache whose entries also expire after `ttl` seconds
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        # Like get, but leaves LRU order and hit/miss counters alone
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_matching(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        # May still count expired entries that nobody has looked up since
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+# Detached snapshot of an Agenda row, safe to share between sessions and threads
+AgendaRecord = namedtuple("AgendaRecord", ["id", "user_id", "calendar_id", "slot_duration", "alias_name", "is_active"])
+
+agenda_cache = TTLCache(int(os.getenv("AGENDA_CACHE_SIZE", 1024)), float(os.getenv("AGENDA_CACHE_TTL", 300)))
+# (user_id, agenda_id, local date) -> list of slots for that day
+slot_cache = TTLCache(int(os.getenv("SLOT_CACHE_SIZE", 8192)), float(os.getenv("SLOT_CACHE_TTL", 60)))
+# user_id -> (AvailabilityMask, tzinfo), see app.slots
+availability_cache = TTLCache(int(os.getenv("AVAILABILITY_CACHE_SIZE", 4096)), float(os.getenv("AVAILABILITY_CACHE_TTL", 600)))
+# ("agenda", alias_name) or ("user", user_id) -> FeedState, ("token", user_id) -> feed token version, see app.feeds
+feed_cache = TTLCache(int(os.getenv("FEED_CACHE_SIZE", 4096)), float(os.getenv("FEED_CACHE_TTL", 60)))
+# Keys invalidated within the last REPLICA_PIN_SECONDS: reads that would refill them must not come from a
+# lagging replica (see app.replicas), or the stale rows would be cached for a whole TTL
+recent_writes = TTLCache(int(os.getenv("RECENT_WRITES_SIZE", 65536)), float(os.getenv("REPLICA_PIN_SECONDS", 5)))
+
+def get_active_agenda(db: Session, alias_name: str):
+    record = agenda_cache.get(alias_name)
+    if record is not None:
+        return record
+    row = db.query(
+        Agenda.id, Agenda.user_id, Agenda.calendar_id, Agenda.slot_duration, Agenda.alias_name, Agenda.is_active
+    ).filter(Agenda.alias_name == alias_name, Agenda.is_active == True).first()
+    if row is None:
+        return None
+    record = AgendaRecord(*row)
+    agenda_cache.set(alias_name, record)
+    return record
+
+def invalidate_agenda(alias_name: str, agenda_id: int = None):
+    agenda_cache.pop(alias_name)
+    feed_cache.pop(("agenda", alias_name))
+    recent_writes.set(("agenda", alias_name), True)
+    if agenda_id is not None:
+        invalidate_agenda_slots(agenda_id)
+
+def invalidate_agenda_slots(agenda_id: int):
+    slot_cache.pop_matching(lambda key: key[1] == agenda_id)
+    recent_writes.set(("agenda_id", agenda_id), True)
+
+def invalidate_user_slots(user_id: int):
+    slot_cache.pop_matching(lambda key: key[0] == user_id)
+    recent_writes.set(("user", user_id), True)
+
+def invalidate_feeds(user_id: int, alias_name: str = None):
+    feed_cache.pop(("user", user_id))
+    if alias_name is not None:
+        feed_cache.pop(("agenda", alias_name))
+
+def cache_stats():
+    return {
+        "agendas": agenda_cache.stats(),
+        "slots": slot_cache.stats(),
+        "availability": availability_cache.stats(),
+        "feeds": feed_cache.stats(),
+    }
@@ -0,0 +1,219 @@
+from sqlalchemy import select, delete, update, and_
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects import sqlite, postgresql
+from app.models.user import User
+from app.models.calendar import Calendar, CalendarEvent
+from app.async_db import AsyncSessionLocal
+from app.tokens import token_manager, TokenRejected
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import datetime
+import asyncio
+import logging
+import os
+
+# Calendar sync engine, run as a separate process: python -m app.calendar_sync
+# Mirrors secondary calendars into each user's primary calendar, fetching only changes since the last run.
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", 16))
+SYNC_INTERVAL_SECONDS = float(os.getenv("SYNC_INTERVAL_SECONDS", 300))
+
+logger = logging.getLogger("smartcal.sync")
+
+# cancelled=True means the event was deleted at the provider
+SyncEvent = namedtuple("SyncEvent", ["external_id", "title", "start_time", "end_time", "cancelled"])
+# A page of changes: `cursor` is set while more pages follow, `sync_token` on the last page
+SyncPage = namedtuple("SyncPage", ["events", "cursor", "sync_token"])
+SyncTarget = namedtuple("SyncTarget", [
+    "calendar_id", "user_id", "alias", "external_id", "subject_prefix", "sync_token", "sync_cursor",
+    "primary_calendar_id", "provider", "access_token", "token_expiry",
+])
+
+class SyncTokenExpired(Exception):
+    # The provider no longer knows the sync token (e.g. Google's 410 Gone); a full re-sync is needed
+    pass
+
+class CalendarProvider(ABC):
+    # Implementations should share one HTTP client whose connection pool is sized to SYNC_CONCURRENCY
+    name = None
+
+    @abstractmethod
+    async def fetch_changes(self, calendar_id: str, access_token: str, sync_token: str = None, cursor: str = None) -> SyncPage:
+        # Without a sync token: every live event. With one: changes since it, including cancellations.
+        ...
+
+_providers = {}
+
+def register_provider(provider: CalendarProvider):
+    _providers[provider.name] = provider
+    return provider
+
+def get_provider(name: str):
+    return _providers.get(name)
+
+class FakeCalendarProvider(CalendarProvider):
+    # In-memory provider with Google-style change log, paging and token expiry, for local runs and tests
+    name = "fake"
+
+    def __init__(self, page_size: int = 250, latency: float = 0.0):
+        self.page_size = page_size
+        self.latency = latency
+        self.requests = 0
+        self._log = {}  # calendar id -> [SyncEvent] in change order
+        self._expired_before = {}  # calendar id -> oldest log position still accepted as a token
+
+    def put_event(self, calendar_id: str, external_id: str, title: str, start_time: datetime, end_time: datetime):
+        self._log.setdefault(calendar_id, []).append(SyncEvent(external_id, title, start_time, end_time, False))
+
+    def cancel_event(self, calendar_id: str, external_id: str):
+        self._log.setdefault(calendar_id, []).append(SyncEvent(external_id, None, None, None, True))
+
+    def expire_tokens(self, calendar_id: str):
+        self._expired_before[calendar_id] = len(self._log.get(calendar_id, []))
+
+    async def fetch_changes(self, calendar_id, access_token, sync_token=None, cursor=None):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        log = self._log.get(calendar_id, [])
+        if cursor is not None:
+            since, upto, offset = map(int, cursor.split(":"))
+        else:
+            since = int(sync_token) if sync_token is not None else 0
+            if sync_token is not None and since < self._expired_before.get(calendar_id, 0):
+                raise SyncTokenExpired(calendar_id)
+            upto, offset = len(log), 0
+        # Latest state per event within the window; a full sync leaves out deleted events
+        latest = {}
+        for event in log[since:upto]:
+            latest.pop(event.external_id, None)
+            latest[event.external_id] = event
+        changes = [event for event in latest.values() if sync_token is not None or not event.cancelled]
+        page = changes[offset:offset + self.page_size]
+        if offset + self.page_size < len(changes):
+            return SyncPage(page, f"{since}:{upto}:{offset + self.page_size}", None)
+        return SyncPage(page, None, str(upto))
+
+register_provider(FakeCalendarProvider())
+
+def map_title(subject_prefix: str, title: str) -> str:
+    # Without a prefix only the busy time is mirrored, never the secondary calendar's titles
+    return "[Busy]" if not subject_prefix else f"{subject_prefix} {title}"
+
+def _upsert(dialect_name: str):
+    # Bulk upsert keyed on (source_calendar_id, external_id); both supported dialects share the syntax
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    stmt = dialect.insert(CalendarEvent.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=["source_calendar_id", "external_id"],
+        set_={name: stmt.excluded[name] for name in ("calendar_id", "title", "start_time", "end_time", "updated_at")},
+    )
+
+async def load_sync_targets(db, user_ids=None):
+    # Every secondary calendar of a user with a provider and a primary calendar, in one query
+    primary = aliased(Calendar)
+    query = select(
+        Calendar.id, Calendar.user_id, Calendar.alias, Calendar.external_id, Calendar.subject_prefix, Calendar.sync_token,
+        Calendar.sync_cursor, primary.id, User.provider, User.access_token, User.token_expiry,
+    ).join(User, User.id == Calendar.user_id).join(
+        primary, and_(primary.user_id == Calendar.user_id, primary.is_primary == True)
+    ).where(Calendar.is_primary == False, User.provider != None, User.refresh_token != None)
+    if user_ids is not None:
+        query = query.where(Calendar.user_id.in_(list(user_ids)))
+    return [SyncTarget(*row) for row in (await db.execute(query)).all()]
+
+async def _apply_page(db, target: SyncTarget, page: SyncPage, now: datetime):
+    upserts = [{
+        "calendar_id": target.primary_calendar_id,
+        "source_calendar_id": target.calendar_id,
+        "external_id": event.external_id,
+        "title": map_title(target.subject_prefix, event.title),
+        "start_time": event.start_time,
+        "end_time": event.end_time,
+        "updated_at": now,
+    } for event in page.events if not event.cancelled]
+    cancelled = [event.external_id for event in page.events if event.cancelled]
+    if upserts:
+        await db.execute(_upsert(db.bind.dialect.name), upserts)
+    if cancelled:
+        await db.execute(delete(CalendarEvent).where(
+            CalendarEvent.source_calendar_id == target.calendar_id, CalendarEvent.external_id.in_(cancelled)
+        ))
+    values = {"sync_cursor": page.cursor}
+    if page.sync_token is not None:
+        values.update(sync_token=page.sync_token, last_synced_at=now)
+    await db.execute(update(Calendar).where(Calendar.id == target.calendar_id).values(**values))
+
+async def sync_calendar(target: SyncTarget, provider: CalendarProvider, fetch_slots: asyncio.Semaphore, write_lock: asyncio.Lock) -> int:
+    # Fetches run concurrently up to fetch_slots; writes are serialised because SQLite has one writer.
+    # Each page commits with its cursor, so an interrupted run resumes where it stopped.
+    sync_token, cursor = target.sync_token, target.sync_cursor
+    reset = False
+    retried_auth = False
+    applied = 0
+    while True:
+        async with fetch_slots:
+            try:
+                access_token = await token_manager.get_token(target.user_id)
+                page = await provider.fetch_changes(target.external_id, access_token, sync_token, cursor)
+            except TokenRejected:
+                if retried_auth:
+                    raise
+                token_manager.invalidate(target.user_id)
+                retried_auth = True
+                continue
+            except SyncTokenExpired:
+                if sync_token is None:
+                    raise
+                logger.info("Sync token expired for calendar %s, re-syncing", target.calendar_id)
+                sync_token, cursor, reset = None, None, True
+                continue
+        async with write_lock:
+            async with AsyncSessionLocal() as db:
+                if reset:
+                    await db.execute(delete(CalendarEvent).where(CalendarEvent.source_calendar_id == target.calendar_id))
+                    reset = False
+                await _apply_page(db, target, page, datetime.utcnow())
+                await db.commit()
+        applied += len(page.events)
+        if page.cursor is None:
+            return applied
+        cursor = page.cursor
+
+async def sync_calendars(user_ids=None, concurrency: int = SYNC_CONCURRENCY) -> dict:
+    # {calendar_id: changes applied}; a failing calendar is logged and left for the next run
+    async with AsyncSessionLocal() as db:
+        targets = await load_sync_targets(db, user_ids)
+    fetch_slots = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    jobs = []
+    for target in targets:
+        provider = get_provider(target.provider)
+        if provider is None:
+            logger.warning("No sync provider %r for calendar %s", target.provider, target.calendar_id)
+            continue
+        target = target._replace(external_id=target.external_id or target.alias)
+        token_manager.seed(target.user_id, target.provider, target.access_token, target.token_expiry)
+        jobs.append((target, sync_calendar(target, provider, fetch_slots, write_lock)))
+    results = await asyncio.gather(*(job for _, job in jobs), return_exceptions=True)
+    applied = {}
+    for (target, _), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logger.error("Sync failed for calendar %s: %r", target.calendar_id, result)
+        else:
+            applied[target.calendar_id] = result
+    return applied
+
+async def run_sync_loop(interval: float = SYNC_INTERVAL_SECONDS):
+    # Tokens are refreshed ahead of expiry alongside the sync runs, in the same event loop
+    async with AsyncSessionLocal() as db:
+        await token_manager.load(db)
+    refresher = asyncio.create_task(token_manager.run())
+    try:
+        while True:
+            await sync_calendars()
+            await asyncio.sleep(interval)
+    finally:
+        refresher.cancel()
+
+if __name__ == "__main__":
+    asyncio.run(run_sync_loop())
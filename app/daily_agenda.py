@@ -0,0 +1,205 @@
+from sqlalchemy import update
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import Session
+from app.models.user import User
+from app.models.daily_agenda import DailyAgendaSchedule
+from app.models.outbox import EmailOutbox
+from app.models.agenda import Agenda
+from app.models.meeting import Meeting
+from app.utils import SessionLocal
+from datetime import datetime, timedelta, time as dt_time
+from string import Template
+import logging
+import os
+import time
+import pytz
+
+# Daily agenda dispatcher, run as a separate process: python -m app.daily_agenda
+AGENDA_BATCH_SIZE = int(os.getenv("AGENDA_BATCH_SIZE", 1000))
+AGENDA_TICK_SECONDS = float(os.getenv("AGENDA_TICK_SECONDS", 30))
+# A late or restarted dispatcher still sends agendas that fell due this long ago; older ones are skipped
+AGENDA_CATCHUP_HOURS = float(os.getenv("AGENDA_CATCHUP_HOURS", 6))
+
+logger = logging.getLogger("smartcal.daily_agenda")
+
+def next_fire_time(send_time: str, tz_name: str, after: datetime, not_before=None):
+    # First local `send_time` strictly after `after` (naive UTC) as (naive UTC, local date), or None if
+    # the user has no usable schedule. Each day is localised separately so DST changes apply per date:
+    # a time inside a spring-forward gap fires at the shifted wall time, an ambiguous one fires once.
+    if not send_time or not tz_name:
+        return None
+    try:
+        tz = pytz.timezone(tz_name)
+    except pytz.UnknownTimeZoneError:
+        return None
+    hour, minute = map(int, send_time.split(":"))
+    day = pytz.utc.localize(after).astimezone(tz).date()
+    if not_before is not None and day < not_before:
+        day = not_before
+    for offset in range(3):
+        local_day = day + timedelta(days=offset)
+        fire_at = tz.localize(datetime.combine(local_day, dt_time(hour, minute)), is_dst=False)
+        fire_at = fire_at.astimezone(pytz.utc).replace(tzinfo=None)
+        if fire_at > after:
+            return fire_at, local_day
+    return None
+
+def schedule_daily_agenda(db: Session, user: User, now: datetime = None):
+    # Call in the same transaction as any change to send_daily_agenda, agenda_send_time or timezone
+    now = now or datetime.utcnow()
+    row = db.get(DailyAgendaSchedule, user.id)
+    not_before = row.last_sent_date + timedelta(days=1) if row is not None and row.last_sent_date else None
+    fire = None
+    if user.send_daily_agenda:
+        fire = next_fire_time(user.agenda_send_time, user.timezone, now, not_before)
+    if fire is None:
+        if row is not None and row.disabled_at is None:
+            row.disabled_at = now
+        return None
+    if row is None:
+        row = DailyAgendaSchedule(user_id=user.id)
+        db.add(row)
+    row.next_fire_at, row.local_date = fire
+    row.disabled_at = None
+    return row
+
+def _local_day_bounds(tz, local_day):
+    # [start, end) of a local calendar day as naive UTC; DST days are 23 or 25 hours long
+    start = tz.localize(datetime.combine(local_day, dt_time.min), is_dst=False)
+    end = tz.localize(datetime.combine(local_day + timedelta(days=1), dt_time.min), is_dst=False)
+    return start.astimezone(pytz.utc).replace(tzinfo=None), end.astimezone(pytz.utc).replace(tzinfo=None)
+
+def get_todays_meetings(db: Session, due) -> dict:
+    # due: [(user_id, local_date, tz_name)] -> {user_id: [meeting dicts in local time, by start]}
+    # One query for the whole batch over the union of everyone's local day, narrowed per user in memory.
+    # Users whose timezone no longer resolves are left out of the result.
+    windows = {}
+    for user_id, local_day, tz_name in due:
+        try:
+            tz = pytz.timezone(tz_name)
+        except pytz.UnknownTimeZoneError:
+            continue
+        windows[user_id] = (tz, *_local_day_bounds(tz, local_day))
+    meetings = {user_id: [] for user_id in windows}
+    if not windows:
+        return meetings
+    range_start = min(start for _, start, _ in windows.values())
+    range_end = max(end for _, _, end in windows.values())
+    rows = db.query(
+        Agenda.user_id, Meeting.start_time, Meeting.end_time, Meeting.booked_by_email, Meeting.meeting_type, Agenda.alias_name
+    ).join(Agenda, Agenda.id == Meeting.agenda_id).filter(
+        Agenda.user_id.in_(list(windows)),
+        Meeting.start_time < range_end,
+        Meeting.start_time >= range_start,
+    ).order_by(Meeting.start_time).all()
+    for user_id, start_time, end_time, booked_by_email, meeting_type, alias_name in rows:
+        tz, day_start, day_end = windows[user_id]
+        if day_start <= start_time < day_end:
+            meetings[user_id].append({
+                "time": pytz.utc.localize(start_time).astimezone(tz).strftime("%H:%M"),
+                "end_time": pytz.utc.localize(end_time).astimezone(tz).strftime("%H:%M"),
+                "title": f"{meeting_type.capitalize()} meeting with {booked_by_email}",
+                "agenda": alias_name,
+            })
+    return meetings
+
+# Compiled once per process; rendering is plain substitution per user
+_AGENDA_TEMPLATE = Template("Your meetings for today:\n$lines")
+_AGENDA_LINE = Template("$time-$end_time - $title ($agenda)")
+_EMPTY_AGENDA = "You have no meetings today."
+
+def render_agenda(meetings) -> str:
+    if not meetings:
+        return _EMPTY_AGENDA
+    return _AGENDA_TEMPLATE.substitute(lines="\n".join([_AGENDA_LINE.substitute(m) for m in meetings]))
+
+def _insert_outbox(dialect_name: str):
+    # A row already queued under the same idempotency key (e.g. by a second dispatcher) is left alone
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    return dialect.insert(EmailOutbox).on_conflict_do_nothing(index_elements=[EmailOutbox.idempotency_key])
+
+def dispatch_due(db: Session, now: datetime = None, limit: int = AGENDA_BATCH_SIZE) -> int:
+    # One indexed range scan on next_fire_at per batch, so the cost depends on who is due, not on
+    # how many users are subscribed. Agendas go to the outbox and the schedule advances in one commit.
+    # A second dispatcher racing on the same rows cannot queue an agenda twice: the outbox insert skips
+    # idempotency keys that already exist.
+    now = now or datetime.utcnow()
+    due = db.query(
+        DailyAgendaSchedule.user_id,
+        DailyAgendaSchedule.next_fire_at,
+        DailyAgendaSchedule.local_date,
+        DailyAgendaSchedule.last_sent_date,
+        User.email,
+        User.agenda_send_time,
+        User.timezone,
+    ).join(User, User.id == DailyAgendaSchedule.user_id).filter(
+        DailyAgendaSchedule.disabled_at == None,
+        DailyAgendaSchedule.next_fire_at <= now,
+    ).order_by(DailyAgendaSchedule.next_fire_at).limit(limit).all()
+    if not due:
+        return 0
+    catchup_from = now - timedelta(hours=AGENDA_CATCHUP_HOURS)
+    meetings = get_todays_meetings(db, [
+        (user_id, local_date, tz_name) for user_id, fire_at, local_date, _, _, _, tz_name in due if fire_at >= catchup_from
+    ])
+    emails = []
+    schedule_updates = []
+    unschedulable = []
+    for user_id, fire_at, local_date, last_sent_date, email, send_time, tz_name in due:
+        if user_id in meetings:
+            emails.append({
+                "idempotency_key": f"daily-agenda:{user_id}:{local_date.isoformat()}",
+                "to_email": email,
+                "subject": "Your Daily Agenda",
+                "body": render_agenda(meetings[user_id]),
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+            })
+            last_sent_date = local_date
+        fire = next_fire_time(send_time, tz_name, now, local_date + timedelta(days=1))
+        if fire is None:
+            unschedulable.append(user_id)
+            continue
+        schedule_updates.append({
+            "user_id": user_id,
+            "next_fire_at": fire[0],
+            "local_date": fire[1],
+            "last_sent_date": last_sent_date,
+        })
+    if emails:
+        db.execute(_insert_outbox(db.bind.dialect.name), emails)
+    if schedule_updates:
+        db.execute(update(DailyAgendaSchedule), schedule_updates)
+    if unschedulable:
+        db.query(DailyAgendaSchedule).filter(DailyAgendaSchedule.user_id.in_(unschedulable)).update(
+            {DailyAgendaSchedule.disabled_at: now}, synchronize_session=False
+        )
+    db.commit()
+    return len(due)
+
+def agenda_scheduler(db: Session, now: datetime = None) -> int:
+    # Drain everything due at `now`, batch by batch; returns the number of schedule rows handled
+    total = 0
+    while True:
+        handled = dispatch_due(db, now)
+        total += handled
+        if handled < AGENDA_BATCH_SIZE:
+            return total
+
+def run_dispatcher(tick_seconds: float = AGENDA_TICK_SECONDS):
+    db = SessionLocal()
+    try:
+        while True:
+            try:
+                agenda_scheduler(db)
+            except Exception:
+                # A failed tick (database locked, bad row) is retried on the next one instead of ending the process
+                logger.exception("Daily agenda tick failed")
+                db.rollback()
+            time.sleep(tick_seconds)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    run_dispatcher()
@@ -1,7 +1,12 @@
 from app.models import User
 from app.utils import engine
 from app.models.user import Base
+from app.migrations import run_migrations
 
 if __name__ == "__main__":
     Base.metadata.create_all(bind=engine)
-    # NOTE: If you change models, re-run this script to update the database schema. 
\ No newline at end of file
+    # create_all never alters existing tables; versioned migrations bring older databases up to date
+    applied = run_migrations(engine)
+    if applied:
+        print(f"Applied migrations: {applied}")
+    # NOTE: If you change models, re-run this script to update the database schema.
@@ -0,0 +1,88 @@
+from email.mime.text import MIMEText
+from app.utils import SessionLocal
+from app.outbox import EMAIL_FROM, claim_batch, mark_sent, mark_failed
+import logging
+import os
+import smtplib
+import socket
+import time
+
+# Outbox delivery worker, run as a separate process: python -m app.email_worker
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 1025))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 10))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 100))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", 1))
+
+logger = logging.getLogger("smartcal.email_worker")
+
+class SMTPConnection:
+    # One SMTP session reused across messages and batches; reconnects once if the server dropped it
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._server = None
+
+    def _connect(self):
+        self.close()
+        self._server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+    def send(self, msg):
+        if self._server is None:
+            self._connect()
+        try:
+            self._server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self._connect()
+            self._server.send_message(msg)
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+def build_message(outbox):
+    msg = MIMEText(outbox.body)
+    msg["Subject"] = outbox.subject
+    msg["From"] = EMAIL_FROM
+    msg["To"] = outbox.to_email
+    # Stable Message-ID from the idempotency key lets receivers drop a redelivered duplicate
+    msg["Message-ID"] = f"<{outbox.idempotency_key}@{EMAIL_FROM.split('@')[-1]}>"
+    return msg
+
+def drain_once(db, smtp: SMTPConnection, worker_id: str, limit: int = EMAIL_BATCH_SIZE) -> int:
+    batch = claim_batch(db, worker_id, limit)
+    for outbox in batch:
+        try:
+            smtp.send(build_message(outbox))
+            mark_sent(outbox)
+        except (smtplib.SMTPException, OSError) as e:
+            mark_failed(outbox, repr(e))
+        except Exception as e:
+            # One message that cannot be built or sent must not leave the rest of the batch leased
+            logger.exception("Sending outbox message %s failed", outbox.id)
+            mark_failed(outbox, repr(e))
+        # Commit each outcome as it happens, so a worker that dies mid-batch only leaves unsent
+        # messages leased; messages already sent are not sent again once the lease expires
+        db.commit()
+    return len(batch)
+
+def run_worker(poll_interval: float = EMAIL_POLL_INTERVAL):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    smtp = SMTPConnection()
+    db = SessionLocal()
+    try:
+        while True:
+            # Keep draining while batches come back full, sleep when the outbox is empty
+            if drain_once(db, smtp, worker_id) < EMAIL_BATCH_SIZE:
+                time.sleep(poll_interval)
+    finally:
+        smtp.close()
+        db.close()
+
+if __name__ == "__main__":
+    run_worker()
@@ -0,0 +1,168 @@
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+from app.models.agenda import Agenda
+from app.models.meeting import Meeting
+from app.models.user import User
+from app.cache import feed_cache
+from app.utils import SessionLocal
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import os
+
+# .ics feeds of booked meetings, per agenda and per user. Each feed is versioned by Agenda.feed_version and
+# User.feed_version, which every booking bumps in its own transaction, so polling clients are answered 304 from feed_cache alone.
+FEED_PAST_DAYS = int(os.getenv("FEED_PAST_DAYS", 90))
+FEED_BATCH_SIZE = 1000
+FEED_DOMAIN = "smartcal.one"
+
+# version is Agenda.feed_version, or User.feed_version for a user feed
+FeedState = namedtuple("FeedState", ["user_id", "agenda_id", "version", "updated_at"])
+
+def bump_feed_version(agenda_id: int):
+    # Run inside the transaction that writes the meetings
+    return update(Agenda).where(Agenda.id == agenda_id).values(
+        feed_version=func.coalesce(Agenda.feed_version, 0) + 1,
+        feed_updated_at=datetime.utcnow(),
+    ).returning(Agenda.user_id, Agenda.alias_name).execution_options(synchronize_session=False)
+
+def feed_token_version(db: Session, user_id: int):
+    # The user's current feed token version, or None if the user is gone; cached like the feed states
+    key = ("token", user_id)
+    version = feed_cache.get(key)
+    if version is None:
+        row = db.query(User.feed_token_version).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        version = row.feed_token_version or 0
+        feed_cache.set(key, version)
+    return version
+
+def rotate_feed_token(db: Session, user_id: int) -> int:
+    # Revokes every feed URL issued so far; the caller commits, then drops ("token", user_id) from feed_cache
+    return db.execute(
+        update(User).where(User.id == user_id).values(
+            feed_token_version=func.coalesce(User.feed_token_version, 0) + 1
+        ).returning(User.feed_token_version).execution_options(synchronize_session=False)
+    ).scalar_one()
+
+def bump_user_feed_version(agenda_id: int):
+    # Run next to bump_feed_version: the user feed keeps a counter of its own rather than summing its agendas'
+    # versions, so it only ever goes up and an old ETag cannot match again, whatever happens to an agenda.
+    # Anything that removes an agenda or its meetings must bump it too.
+    owner = select(Agenda.user_id).where(Agenda.id == agenda_id).scalar_subquery()
+    return update(User).where(User.id == owner).values(
+        feed_version=func.coalesce(User.feed_version, 0) + 1,
+        feed_updated_at=datetime.utcnow(),
+    ).execution_options(synchronize_session=False)
+
+def agenda_feed_state(db: Session, alias_name: str):
+    key = ("agenda", alias_name)
+    state = feed_cache.get(key)
+    if state is None:
+        row = db.query(Agenda.user_id, Agenda.id, Agenda.feed_version, Agenda.feed_updated_at).filter(
+            Agenda.alias_name == alias_name
+        ).first()
+        if row is None:
+            return None
+        state = FeedState(row.user_id, row.id, row.feed_version or 0, row.feed_updated_at)
+        feed_cache.set(key, state)
+    return state
+
+def user_feed_state(db: Session, user_id: int):
+    key = ("user", user_id)
+    state = feed_cache.get(key)
+    if state is None:
+        row = db.query(User.feed_version, User.feed_updated_at).filter(User.id == user_id).first()
+        state = FeedState(user_id, None, row.feed_version or 0, row.feed_updated_at) if row else FeedState(user_id, None, 0, None)
+        feed_cache.set(key, state)
+    return state
+
+def feed_window_start(now: datetime = None) -> datetime:
+    # Whole UTC days, so the feed content (and its validators) only move once a day without bookings
+    now = now or datetime.utcnow()
+    return datetime.combine(now.date() - timedelta(days=FEED_PAST_DAYS), datetime.min.time())
+
+def feed_validators(state: FeedState, window_start: datetime):
+    # (ETag, Last-Modified); both change with the version and with the daily window
+    owner = f"a{state.agenda_id}" if state.agenda_id is not None else f"u{state.user_id}"
+    etag = f'"{owner}-{state.version}-{window_start:%Y%m%d}"'
+    last_modified = max(state.updated_at or window_start, window_start).replace(microsecond=0)
+    return etag, last_modified
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+def is_not_modified(if_none_match: str, if_modified_since: str, etag: str, last_modified: datetime) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110, 13.2.2)
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        return last_modified <= since
+    return False
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _fold(line: str) -> str:
+    # Content lines are at most 75 octets; continuation lines start with a space (RFC 5545, 3.1)
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74
+        while cut and (data[cut] & 0xC0) == 0x80:  # never split a UTF-8 sequence
+            cut -= 1
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+    parts.append(data.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+def _ics_time(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+def _event(row, dtstamp: str) -> str:
+    meeting_id, start_time, end_time, email, meeting_type, virtual_app, status, alias_name = row
+    kind = f"{meeting_type} ({virtual_app})" if virtual_app else meeting_type
+    description = f"Agenda: {alias_name}\nType: {kind}"
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:meeting-{meeting_id}@{FEED_DOMAIN}",
+        f"DTSTAMP:{dtstamp}",
+        f"DTSTART:{_ics_time(start_time)}",
+        f"DTEND:{_ics_time(end_time)}",
+        f"SUMMARY:{_escape(f'Meeting with {email}')}",
+        f"DESCRIPTION:{_escape(description)}",
+        f"STATUS:{'CANCELLED' if status == 'cancelled' else 'CONFIRMED'}",
+        "END:VEVENT",
+    ]
+    return "".join(_fold(line) for line in lines)
+
+def render_feed(state: FeedState, name: str, window_start: datetime, last_modified: datetime):
+    # Generator of .ics text, one batch of meetings at a time from a cursor of its own
+    header = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//SmartCal//Feed//EN", "CALSCALE:GREGORIAN",
+              "METHOD:PUBLISH", f"X-WR-CALNAME:{_escape(name)}"]
+    dtstamp = _ics_time(last_modified)
+    owner = Agenda.id == state.agenda_id if state.agenda_id is not None else Agenda.user_id == state.user_id
+    query = select(
+        Meeting.id, Meeting.start_time, Meeting.end_time, Meeting.booked_by_email, Meeting.meeting_type,
+        Meeting.virtual_app, Meeting.status, Agenda.alias_name,
+    ).join(Agenda, Agenda.id == Meeting.agenda_id).where(
+        owner, Meeting.end_time >= window_start
+    ).order_by(Meeting.start_time, Meeting.id)
+    db = SessionLocal()
+    try:
+        yield "".join(_fold(line) for line in header)
+        for rows in db.execute(query.execution_options(yield_per=FEED_BATCH_SIZE)).partitions():
+            yield "".join(_event(row, dtstamp) for row in rows)
+        yield "END:VCALENDAR\r\n"
+    finally:
+        db.close()
@@ -0,0 +1,155 @@
+from contextvars import ContextVar
+from sqlalchemy import event
+import bisect
+import threading
+import time
+
+# Minimal Prometheus text-format registry; metrics register themselves on creation
+REGISTRY = []
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, values, (), value) for values, value in self._values.items()]
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels=(), callback=None):
+        # callback() -> {label_values_tuple: value}, evaluated at scrape time
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self):
+        if self.callback is not None:
+            values = self.callback()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [(self.name, labels, (), value) for labels, value in values.items()]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            series_items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in series_items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                samples.append((self.name + "_bucket", labels, (("le", _format_value(float(bound))),), cumulative))
+            samples.append((self.name + "_bucket", labels, (("le", "+Inf"),), series[-1]))
+            samples.append((self.name + "_sum", labels, (), series[-2]))
+            samples.append((self.name + "_count", labels, (), series[-1]))
+        return samples
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, label_values, extra, value in metric.samples():
+            lines.append(f"{name}{_format_labels(metric.labels, label_values, extra)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+http_requests_total = Counter("http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+db_queries_total = Counter("db_queries_total", "SQL statements executed.", ("engine",))
+db_query_duration_seconds = Histogram("db_query_duration_seconds", "SQL statement latency.", ("engine",))
+db_queries_per_request = Histogram("db_queries_per_request", "SQL statements executed per HTTP request.", ("method", "route"), QUERY_COUNT_BUCKETS)
+rate_limit_rejections_total = Counter("rate_limit_rejections_total", "Requests rejected by the rate limiter.", ("rule",))
+
+# Per-request [query count]; a mutable holder so threadpool copies of the context share it
+current_request_queries = ContextVar("current_request_queries", default=None)
+
+def instrument_engine(engine, name: str):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        db_queries_total.inc(name)
+        db_query_duration_seconds.observe(elapsed, name)
+        holder = current_request_queries.get()
+        if holder is not None:
+            holder[0] += 1
+
+def pool_stats(engines):
+    # {(engine, stat): value} for pools that expose QueuePool-style counters
+    values = {}
+    for name, engine in engines.items():
+        pool = engine.pool
+        for stat in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, stat, None)
+            if callable(method):
+                values[(name, stat)] = method()
+    return values
@@ -1,19 +1,137 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+import atexit
+import json
 import logging
+import os
+import random
 import time
+import traceback
+from starlette.responses import JSONResponse
+from app.metrics import http_requests_total, http_request_duration_seconds, db_queries_per_request, current_request_queries, rate_limit_rejections_total
 
-logger = logging.getLogger("uvicorn.error")
+access_logger = logging.getLogger("smartcal.access")
+
+# Fraction of successful requests that get an access log line; 5xx and exceptions are always logged
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        return json.dumps(payload, default=str)
+
+_listener = None
+
+def setup_access_logging(handler: logging.Handler = None):
+    # Request handlers only enqueue records; a listener thread does the formatting and I/O
+    global _listener
+    if _listener is not None:
+        return
+    handler = handler or logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    queue = SimpleQueue()
+    access_logger.addHandler(QueueHandler(queue))
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+    _listener = QueueListener(queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+def route_template(scope) -> str:
+    # Matched route path such as '/agendas/public/{alias_name}/slots'; raw path if nothing matched
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "")
+
+class LoggingMiddleware:
+    # Pure ASGI middleware: no per-request task or body stream wrapping, unlike BaseHTTPMiddleware
+    def __init__(self, app, sample_rate: float = LOG_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        setup_access_logging()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
         try:
-            response = await call_next(request)
-            process_time = (time.time() - start_time) * 1000
-            logger.info(f"{request.method} {request.url.path} - {response.status_code} - {process_time:.2f}ms")
-            return response
+            await self.app(scope, receive, send_with_status)
         except Exception as exc:
-            logger.error(f"Error processing request {request.method} {request.url.path}: {exc}")
-            raise 
\ No newline at end of file
+            fields = self._fields(scope, 500, start_time)
+            # QueueHandler drops exc_info when it enqueues, so the traceback travels as a field
+            fields["exc"] = "".join(traceback.format_exception(exc))
+            access_logger.error("request failed", extra={"fields": fields})
+            raise
+        if status_code >= 500 or self.sample_rate >= 1 or random.random() < self.sample_rate:
+            level = logging.ERROR if status_code >= 500 else logging.INFO
+            access_logger.log(level, "request", extra={"fields": self._fields(scope, status_code, start_time)})
+
+    @staticmethod
+    def _fields(scope, status_code: int, start_time: float):
+        return {
+            "method": scope["method"],
+            "route": route_template(scope),
+            "status": status_code,
+            "duration_ms": round((time.perf_counter() - start_time) * 1000, 2),
+        }
+
+class MetricsMiddleware:
+    # Per-route request counts, latency and SQL statements per request, labelled by route template
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start_time = time.perf_counter()
+        status_code = 500
+        queries = [0]
+        token = current_request_queries.set(queries)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request_queries.reset(token)
+            method, route = scope["method"], route_template(scope) if scope.get("route") else "<unmatched>"
+            http_requests_total.inc(method, route, str(status_code))
+            http_request_duration_seconds.observe(time.perf_counter() - start_time, method, route)
+            db_queries_per_request.observe(queries[0], method, route)
+
+class RateLimitMiddleware:
+    # Registered inside LoggingMiddleware and MetricsMiddleware so 429s are logged and counted like any response
+    def __init__(self, app, limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        client = scope.get("client")
+        rejected_by = await self.limiter.check_async(client[0] if client else "", scope["method"], scope["path"])
+        if rejected_by is not None:
+            rate_limit_rejections_total.inc(rejected_by.name)
+            await JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"})(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
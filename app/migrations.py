@@ -0,0 +1,96 @@
+from sqlalchemy import text, select, insert, inspect
+from sqlalchemy.engine import Engine
+from app.models import User, AvailabilitySlot, Calendar, CalendarEvent, Agenda, Meeting, TeamMember, DailyAgendaSchedule
+from app.daily_agenda import next_fire_time
+from datetime import datetime
+
+# Schema changes that create_all cannot apply to an existing database.
+# Each step runs once, in order, inside its own transaction; append new steps, never edit applied ones.
+
+def _create_indexes(conn, table, *names):
+    for index in table.indexes:
+        if index.name in names:
+            index.create(bind=conn, checkfirst=True)
+
+def _add_columns(conn, table, *names):
+    # Nullable columns only: SQLite cannot add a NOT NULL column without a default
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    for name in names:
+        if name not in existing:
+            column = table.c[name]
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"))
+
+def _add_hot_path_indexes(conn):
+    _create_indexes(conn, Meeting.__table__, "ix_meetings_agenda_id_start_time_end_time")
+    _create_indexes(conn, AvailabilitySlot.__table__, "ix_availability_slots_user_id_day_of_week")
+    _create_indexes(conn, Calendar.__table__, "ix_calendars_user_id_is_primary")
+    _create_indexes(conn, Agenda.__table__, "ix_agendas_user_id")
+    _create_indexes(conn, TeamMember.__table__, "ix_team_members_team_id")
+
+def _backfill_daily_agenda_schedules(conn):
+    # Users who subscribed before the schedule index existed get their next fire time computed once here
+    DailyAgendaSchedule.__table__.create(bind=conn, checkfirst=True)
+    now = datetime.utcnow()
+    rows = []
+    for user_id, send_time, tz_name in conn.execute(
+        select(User.id, User.agenda_send_time, User.timezone).where(User.send_daily_agenda == True)
+    ):
+        fire = next_fire_time(send_time, tz_name, now)
+        if fire is not None:
+            rows.append({"user_id": user_id, "next_fire_at": fire[0], "local_date": fire[1]})
+    if rows:
+        conn.execute(insert(DailyAgendaSchedule.__table__), rows)
+
+def _add_calendar_sync_state(conn):
+    _add_columns(conn, Calendar.__table__, "external_id", "sync_token", "sync_cursor", "last_synced_at")
+    CalendarEvent.__table__.create(bind=conn, checkfirst=True)
+
+def _add_agenda_feed_version(conn):
+    _add_columns(conn, Agenda.__table__, "feed_version", "feed_updated_at")
+
+def _add_user_feed_token_version(conn):
+    _add_columns(conn, User.__table__, "feed_token_version")
+
+def _disable_daily_agenda_schedules(conn):
+    _add_columns(conn, DailyAgendaSchedule.__table__, "disabled_at")
+    _create_indexes(conn, DailyAgendaSchedule.__table__, "ix_daily_agenda_schedules_due")
+    conn.execute(text("DROP INDEX IF EXISTS ix_daily_agenda_schedules_next_fire_at"))
+
+def _add_user_feed_version(conn):
+    # Starts from the sum it replaces, so feeds already polled keep their ETag
+    _add_columns(conn, User.__table__, "feed_version", "feed_updated_at")
+    conn.execute(text(
+        "UPDATE users SET "
+        "feed_version = (SELECT COALESCE(SUM(feed_version), 0) FROM agendas WHERE agendas.user_id = users.id), "
+        "feed_updated_at = (SELECT MAX(feed_updated_at) FROM agendas WHERE agendas.user_id = users.id)"
+    ))
+
+MIGRATIONS = [
+    (1, "add indexes for meetings, availability, calendars, agendas and team members", _add_hot_path_indexes),
+    (2, "backfill daily agenda schedules for subscribed users", _backfill_daily_agenda_schedules),
+    (3, "add calendar sync state and mirrored calendar events", _add_calendar_sync_state),
+    (4, "add agenda feed version for .ics feeds", _add_agenda_feed_version),
+    (5, "add user feed token version for revoking feed URLs", _add_user_feed_token_version),
+    (6, "keep unsubscribed daily agenda schedules, index only the active ones", _disable_daily_agenda_schedules),
+    (7, "add user feed version, which unlike the sum over agendas never goes back", _add_user_feed_version),
+]
+
+def get_schema_version(conn) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL, description VARCHAR(255))"))
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+def run_migrations(engine: Engine):
+    applied = []
+    with engine.begin() as conn:
+        version = get_schema_version(conn)
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description) VALUES (:version, :description)"),
+                {"version": number, "description": description},
+            )
+        applied.append(number)
+    return applied
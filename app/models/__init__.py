@@ -1,6 +1,8 @@
 from .user import User
 from .availability import AvailabilitySlot
-from .calendar import Calendar
+from .calendar import Calendar, CalendarEvent
 from .agenda import Agenda
 from .meeting import Meeting
-from .team import Team, TeamMember 
\ No newline at end of file
+from .team import Team, TeamMember 
+from .outbox import EmailOutbox
+from .daily_agenda import DailyAgendaSchedule
\ No newline at end of file
@@ -1,15 +1,18 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
 from app.models.user import Base
 
 class Agenda(Base):
     __tablename__ = "agendas"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
     calendar_id = Column(Integer, ForeignKey("calendars.id"), nullable=False)
     slot_duration = Column(Integer, nullable=False)  # 30, 45, 60
     alias_name = Column(String(100), unique=True, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
+    # Bumped in the same transaction as every booking; the .ics feeds derive their ETag from it (see app.feeds)
+    feed_version = Column(Integer, default=0, nullable=True)
+    feed_updated_at = Column(DateTime, nullable=True)
 
     user = relationship("User", backref="agendas")
     calendar = relationship("Calendar", backref="agendas") 
\ No newline at end of file
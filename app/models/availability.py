@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, ForeignKey, String, Time
+from sqlalchemy import Column, Integer, ForeignKey, String, Time, Index
 from sqlalchemy.orm import relationship
 from app.models.user import Base
 
 class AvailabilitySlot(Base):
     __tablename__ = "availability_slots"
+    __table_args__ = (
+        Index("ix_availability_slots_user_id_day_of_week", "user_id", "day_of_week"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     day_of_week = Column(Integer, nullable=False)  # 0=Monday, 6=Sunday
@@ -1,14 +1,37 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.models.user import Base
 
 class Calendar(Base):
     __tablename__ = "calendars"
+    __table_args__ = (
+        Index("ix_calendars_user_id_is_primary", "user_id", "is_primary"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     alias = Column(String(100), nullable=False)
     is_primary = Column(Boolean, default=False, nullable=False)
     sync_direction = Column(String(10), default="one-way", nullable=False)  # 'one-way' or 'two-way'
     subject_prefix = Column(String(50), nullable=True)
+    external_id = Column(String(255), nullable=True)  # provider's calendar id, defaults to alias
+    sync_token = Column(Text, nullable=True)  # provider token for the next incremental fetch
+    sync_cursor = Column(Text, nullable=True)  # page cursor while a fetch is in progress
+    last_synced_at = Column(DateTime, nullable=True)
 
-    user = relationship("User", backref="calendars") 
\ No newline at end of file
+    user = relationship("User", backref="calendars")
+
+class CalendarEvent(Base):
+    # Events mirrored from a secondary calendar into its owner's primary calendar by app.calendar_sync
+    __tablename__ = "calendar_events"
+    __table_args__ = (
+        UniqueConstraint("source_calendar_id", "external_id", name="uq_calendar_events_source_calendar_id_external_id"),
+        Index("ix_calendar_events_calendar_id_start_time", "calendar_id", "start_time"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    calendar_id = Column(Integer, ForeignKey("calendars.id"), nullable=False)  # primary calendar
+    source_calendar_id = Column(Integer, ForeignKey("calendars.id"), nullable=False)
+    external_id = Column(String(255), nullable=False)
+    title = Column(String(255), nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False) 
\ No newline at end of file
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, DateTime, Date, ForeignKey, Index, text
+from app.models.user import Base
+
+class DailyAgendaSchedule(Base):
+    # One row per subscribed user holding the next UTC instant their daily agenda is due,
+    # so the dispatcher range-scans due rows instead of checking every user's local clock
+    __tablename__ = "daily_agenda_schedules"
+    __table_args__ = (
+        # Partial, so rows of users who unsubscribed are never scanned
+        Index(
+            "ix_daily_agenda_schedules_due", "next_fire_at",
+            sqlite_where=text("disabled_at IS NULL"), postgresql_where=text("disabled_at IS NULL"),
+        ),
+    )
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    next_fire_at = Column(DateTime, nullable=False)  # naive UTC
+    local_date = Column(Date, nullable=False)  # the user's local date that fire time belongs to
+    last_sent_date = Column(Date, nullable=True)  # keeps a reschedule from sending the same day twice
+    # Set on unsubscribe instead of deleting the row, so last_sent_date survives a resubscribe
+    disabled_at = Column(DateTime, nullable=True)
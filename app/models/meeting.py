@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.models.user import Base
 
 class Meeting(Base):
     __tablename__ = "meetings"
+    __table_args__ = (
+        # Overlap checks filter on agenda_id and range-scan start_time; end_time keeps them index-only
+        Index("ix_meetings_agenda_id_start_time_end_time", "agenda_id", "start_time", "end_time"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     agenda_id = Column(Integer, ForeignKey("agendas.id"), nullable=False)
     start_time = Column(DateTime, nullable=False)
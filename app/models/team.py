@@ -14,7 +14,7 @@ class Team(Base):
 class TeamMember(Base):
     __tablename__ = "team_members"
     id = Column(Integer, primary_key=True, index=True)
-    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), index=True, nullable=False)
     email = Column(String(120), nullable=False)
 
     team = relationship("Team", back_populates="members") 
\ No newline at end of file
@@ -19,4 +19,9 @@ class User(Base):
     provider = Column(String(20), nullable=True)  # 'google', 'outlook', etc.
     refresh_token = Column(Text, nullable=True)
     access_token = Column(Text, nullable=True)
-    token_expiry = Column(DateTime, nullable=True) 
\ No newline at end of file
+    token_expiry = Column(DateTime, nullable=True)
+    # Feed tokens carry the version they were issued with; bumping it revokes every feed URL (see app.feeds)
+    feed_token_version = Column(Integer, default=0, nullable=True)
+    # Version of the user's own feed, bumped with any of their agendas' feed_version (see app.feeds)
+    feed_version = Column(Integer, default=0, nullable=True)
+    feed_updated_at = Column(DateTime, nullable=True) 
\ No newline at end of file
@@ -0,0 +1,75 @@
+from sqlalchemy import or_, func
+from sqlalchemy.orm import Session
+from app.models.outbox import EmailOutbox
+from datetime import datetime, timedelta
+import os
+import uuid
+
+# Emails are written to the outbox in the caller's transaction and delivered by app.email_worker
+EMAIL_FROM = os.getenv("EMAIL_FROM", "noreply@example.com")
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 8))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", 3600))
+EMAIL_LEASE_SECONDS = float(os.getenv("EMAIL_LEASE_SECONDS", 120))
+
+def enqueue_email(db, to_email: str, subject: str, body: str, idempotency_key: str = None):
+    # Works with both Session and AsyncSession: only adds, the caller commits
+    outbox = EmailOutbox(
+        idempotency_key=idempotency_key or uuid.uuid4().hex,
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(outbox)
+    return outbox
+
+def outbox_depth(db: Session) -> int:
+    return db.query(func.count(EmailOutbox.id)).filter(EmailOutbox.status.in_(("pending", "sending"))).scalar()
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_SECONDS))
+
+def claim_batch(db: Session, worker_id: str, limit: int, now: datetime = None):
+    # Lease due rows to this worker. Rows whose lease expired (worker died mid-batch) are claimable
+    # again, so nothing is lost; the conditional UPDATE keeps two workers from claiming the same row.
+    now = now or datetime.utcnow()
+    claimable = or_(EmailOutbox.locked_until == None, EmailOutbox.locked_until < now)
+    ids = [row_id for (row_id,) in db.query(EmailOutbox.id).filter(
+        EmailOutbox.status.in_(("pending", "sending")),
+        EmailOutbox.next_attempt_at <= now,
+        claimable,
+    ).order_by(EmailOutbox.next_attempt_at).limit(limit)]
+    if not ids:
+        return []
+    lease_until = now + timedelta(seconds=EMAIL_LEASE_SECONDS)
+    db.query(EmailOutbox).filter(EmailOutbox.id.in_(ids), claimable).update(
+        {EmailOutbox.status: "sending", EmailOutbox.locked_by: worker_id, EmailOutbox.locked_until: lease_until},
+        synchronize_session=False,
+    )
+    db.commit()
+    return db.query(EmailOutbox).filter(
+        EmailOutbox.id.in_(ids), EmailOutbox.locked_by == worker_id, EmailOutbox.locked_until == lease_until
+    ).all()
+
+def mark_sent(outbox: EmailOutbox, now: datetime = None):
+    outbox.status = "sent"
+    outbox.sent_at = now or datetime.utcnow()
+    outbox.attempts += 1
+    outbox.locked_by = None
+    outbox.locked_until = None
+    outbox.last_error = None
+
+def mark_failed(outbox: EmailOutbox, error: str, now: datetime = None):
+    now = now or datetime.utcnow()
+    outbox.attempts += 1
+    outbox.last_error = error
+    outbox.locked_by = None
+    outbox.locked_until = None
+    if outbox.attempts >= EMAIL_MAX_ATTEMPTS:
+        outbox.status = "failed"
+    else:
+        outbox.status = "pending"
+        outbox.next_attempt_at = now + retry_delay(outbox.attempts)
@@ -0,0 +1,162 @@
+from collections import OrderedDict, namedtuple
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+# A rule allows `limit` requests per `period` seconds per client IP, as a token bucket
+# refilling at limit/period tokens per second with a burst of `limit`.
+RateRule = namedtuple("RateRule", ["name", "method", "pattern", "limit", "period"])
+
+logger = logging.getLogger("smartcal.ratelimit")
+
+def _compile_path(path: str):
+    # '/agendas/public/*/book' -> '*' matches exactly one path segment
+    return re.compile("^" + re.escape(path).replace(r"\*", "[^/]+") + "/?$")
+
+def parse_rules(spec: str):
+    # "POST /users/login 5/60; POST /agendas/public/*/book 10/60"
+    rules = []
+    for item in spec.split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        method, path, quota = item.split()
+        limit, period = quota.split("/")
+        rules.append(RateRule(f"{method} {path}", method.upper(), _compile_path(path), int(limit), float(period)))
+    return rules
+
+def _refill(stored, limit: int, period: float, now: float) -> float:
+    # Tokens in a bucket at `now` given its stored (tokens, updated); a missing bucket is full
+    if stored is None:
+        return float(limit)
+    tokens, updated = stored
+    return min(limit, tokens + (now - updated) * limit / period)
+
+def _take(levels):
+    # Index of the first bucket without a token, or None after taking one token from every bucket.
+    # All or nothing, so a request rejected by one rule does not use up the others.
+    rejected = next((index for index, tokens in enumerate(levels) if tokens < 1), None)
+    if rejected is None:
+        levels[:] = [tokens - 1 for tokens in levels]
+    return rejected
+
+class MemoryBackend:
+    # Per-process token buckets; the OrderedDict doubles as an LRU so idle keys are evicted in O(1) amortised
+    blocking = False
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated, full_at)
+        self._lock = threading.Lock()
+
+    def take(self, buckets, now: float):
+        # buckets: [(key, limit, period)]; returns the index of the bucket that rejected, or None
+        with self._lock:
+            levels = []
+            for key, limit, period in buckets:
+                bucket = self._buckets.get(key)
+                levels.append(_refill(bucket[:2] if bucket is not None else None, limit, period, now))
+            rejected = _take(levels)
+            for (key, limit, period), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens, now, now + (limit - tokens) * period / limit)
+                self._buckets.move_to_end(key)
+            self._evict(now)
+        return rejected
+
+    def _evict(self, now: float):
+        # A bucket that has refilled completely is equivalent to a missing one
+        while self._buckets:
+            key, (_, _, full_at) = next(iter(self._buckets.items()))
+            if full_at > now and len(self._buckets) <= self.max_keys:
+                break
+            self._buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+class SQLiteBackend:
+    # Buckets shared by every worker process through one SQLite file; each check is one short write
+    # transaction. It does blocking I/O, so RateLimiter runs it off the event loop, and a database locked
+    # for longer than `timeout` seconds lets the request through rather than stalling it.
+    blocking = True
+    EVICT_EVERY = 1000
+
+    def __init__(self, path: str, idle_seconds: float = 3600, timeout: float = 0.1):
+        self.idle_seconds = idle_seconds
+        self.failures = 0
+        self._calls = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Limiter state is disposable, no need to fsync it
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, allowed INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_buckets_updated ON rate_buckets (updated)")
+
+    def take(self, buckets, now: float):
+        keys = [key for key, _, _ in buckets]
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                stored = {key: (tokens, updated) for key, tokens, updated in self._conn.execute(
+                    f"SELECT key, tokens, updated FROM rate_buckets WHERE key IN ({', '.join('?' * len(keys))})", keys
+                )}
+                levels = [_refill(stored.get(key), limit, period, now) for key, limit, period in buckets]
+                rejected = _take(levels)
+                self._conn.executemany(
+                    "INSERT INTO rate_buckets (key, tokens, updated, allowed) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated, allowed = excluded.allowed",
+                    [(key, tokens, now, rejected is None) for key, tokens in zip(keys, levels)],
+                )
+                self._calls += 1
+                if self._calls % self.EVICT_EVERY == 0:
+                    self._conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.idle_seconds,))
+                self._conn.execute("COMMIT")
+            except sqlite3.OperationalError as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                self.failures += 1
+                logger.warning("Rate limit check skipped: %r", e)
+                return None
+        return rejected
+
+class RateLimiter:
+    def __init__(self, backend, default_rule: RateRule, rules=()):
+        self.backend = backend
+        self.default_rule = default_rule
+        self.rules = list(rules)
+
+    def match(self, method: str, path: str):
+        for rule in self.rules:
+            if rule.method == method and rule.pattern.match(path):
+                return rule
+        return None
+
+    def check(self, client: str, method: str, path: str):
+        # Returns the rule that rejected the request, or None if it is allowed.
+        # Wall clock rather than monotonic so buckets stay comparable across processes.
+        rules = [rule for rule in (self.match(method, path), self.default_rule) if rule is not None]
+        rejected = self.backend.take([(f"{rule.name}|{client}", rule.limit, rule.period) for rule in rules], time.time())
+        return None if rejected is None else rules[rejected]
+
+    async def check_async(self, client: str, method: str, path: str):
+        # For the middleware: a blocking backend runs in a worker thread so the event loop keeps serving
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.check, client, method, path)
+        return self.check(client, method, path)
+
+    def allow(self, client: str, method: str, path: str) -> bool:
+        return self.check(client, method, path) is None
+
+def create_backend(name: str, sqlite_path: str = "./ratelimit.db", sqlite_timeout: float = 0.1):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SQLiteBackend(sqlite_path, timeout=sqlite_timeout)
+    raise ValueError(f"Unknown rate limit backend: {name}")
@@ -0,0 +1,117 @@
+from fastapi import Request, Response
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from app.database import async_url, create_db_engine, create_async_db_engine
+from app.utils import SessionLocal
+from app.async_db import AsyncSessionLocal
+from app.cache import agenda_cache, recent_writes
+import itertools
+import logging
+import os
+import threading
+import time
+
+# Read-only public endpoints can be served from replicas: DATABASE_REPLICA_URLS is a comma-separated list.
+# Without it every read goes to the primary, exactly as before.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", 5))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", 30))
+PIN_COOKIE = "smartcal_rw"
+
+logger = logging.getLogger("smartcal.replicas")
+
+class ReplicaPool:
+    # Round-robin over replicas; one that fails to connect is skipped for REPLICA_RETRY_SECONDS
+    def __init__(self, session_factories):
+        self.session_factories = list(session_factories)
+        self._down_until = [0.0] * len(self.session_factories)
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.session_factories)
+
+    def candidates(self):
+        now = time.monotonic()
+        with self._lock:
+            start = next(self._turn)
+        count = len(self.session_factories)
+        for offset in range(count):
+            index = (start + offset) % count
+            if self._down_until[index] <= now:
+                yield index, self.session_factories[index]
+
+    def mark_down(self, index: int, error: Exception):
+        logger.warning("Replica %s unavailable, using others or the primary: %r", index, error)
+        self._down_until[index] = time.monotonic() + REPLICA_RETRY_SECONDS
+
+replica_engines = [create_db_engine(url) for url in DATABASE_REPLICA_URLS]
+async_replica_engines = [create_async_db_engine(async_url(url)) for url in DATABASE_REPLICA_URLS]
+replicas = ReplicaPool(sessionmaker(autocommit=False, autoflush=False, bind=e) for e in replica_engines)
+async_replicas = ReplicaPool(
+    async_sessionmaker(e, class_=AsyncSession, autoflush=False, expire_on_commit=False) for e in async_replica_engines
+)
+
+def pin_to_primary(response: Response):
+    # Read-your-writes: this client's reads go to the primary for REPLICA_PIN_SECONDS after its own write
+    if DATABASE_REPLICA_URLS:
+        until = int(time.time() + REPLICA_PIN_SECONDS) + 1
+        response.set_cookie(PIN_COOKIE, str(until), max_age=int(REPLICA_PIN_SECONDS) + 1, httponly=True, samesite="lax")
+
+def _needs_primary(request: Request) -> bool:
+    try:
+        if float(request.cookies.get(PIN_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    if not len(recent_writes):
+        return False
+    # Something was written recently in this process; only the agenda concerned has to read from the primary
+    alias_name = request.path_params.get("alias_name")
+    if alias_name is None or recent_writes.peek(("agenda", alias_name)):
+        return True
+    record = agenda_cache.peek(alias_name)
+    if record is None:
+        return True
+    return bool(recent_writes.peek(("agenda_id", record.id)) or recent_writes.peek(("user", record.user_id)))
+
+def get_read_db(request: Request):
+    db = None
+    if replicas and not _needs_primary(request):
+        for index, factory in replicas.candidates():
+            session = factory()
+            try:
+                session.connection()
+            except OperationalError as e:
+                session.close()
+                replicas.mark_down(index, e)
+                continue
+            db = session
+            break
+    if db is None:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    db = None
+    if async_replicas and not _needs_primary(request):
+        for index, factory in async_replicas.candidates():
+            session = factory()
+            try:
+                await session.connection()
+            except OperationalError as e:
+                await session.close()
+                async_replicas.mark_down(index, e)
+                continue
+            db = session
+            break
+    if db is None:
+        db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
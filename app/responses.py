@@ -0,0 +1,13 @@
+from fastapi.responses import ORJSONResponse
+
+# Fast path for list endpoints: select exactly the columns a response schema declares and serialise the
+# row tuples with orjson, skipping ORM object hydration and per-row response_model validation.
+# The JSON is the same as going through the schema (orm_mode), field order included.
+
+def schema_columns(model, schema):
+    # Columns of `model` named like the fields of `schema`, in field order; evaluated once at import time
+    return tuple(getattr(model, name) for name in schema.__fields__)
+
+def rows_response(rows, schema) -> ORJSONResponse:
+    names = tuple(schema.__fields__)
+    return ORJSONResponse([dict(zip(names, row)) for row in rows])
@@ -2,4 +2,5 @@ from .user import router as user_router
 from .availability import router as availability_router
 from .calendar import router as calendar_router
 from .agenda import router as agenda_router
-from .team import router as team_router 
\ No newline at end of file
+from .team import router as team_router
+from .feed import router as feed_router
\ No newline at end of file
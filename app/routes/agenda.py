@@ -1,22 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from app.models.agenda import Agenda
-from app.models.meeting import Meeting
 from app.schemas.agenda import AgendaCreate, AgendaUpdate, AgendaResponse
 from app.schemas.meeting import MeetingCreate, MeetingResponse
-from app.utils import get_db, get_current_user, send_reset_email
-from app.models.user import User
-from datetime import datetime, timedelta
-import os
+from app.utils import get_db, get_current_principal, Principal
+from app.outbox import enqueue_email
+from app.booking import book_atomically, BookingRejected, BookingContention
+from app.feeds import bump_feed_version, bump_user_feed_version
+from app.async_db import get_async_db, AsyncSessionLocal
+from app.slot_events import slot_events, sse_stream, SLOT_TAKEN
+from app.responses import schema_columns, rows_response
+from app.replicas import get_read_db, get_async_read_db, pin_to_primary
+from app.cache import get_active_agenda, invalidate_agenda, invalidate_agenda_slots, invalidate_feeds
+from app.slots import compute_available_slots, DEFAULT_HORIZON_DAYS, MAX_HORIZON_DAYS
 
 router = APIRouter()
 
 # Configurable max bookings per visitor per agenda (could be a user field, here as constant for demo)
 MAX_BOOKINGS_PER_VISITOR = 3
 
+AGENDA_COLUMNS = schema_columns(Agenda, AgendaResponse)
+
 @router.post("/", response_model=AgendaResponse)
-def create_agenda(agenda: AgendaCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_agenda(agenda: AgendaCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     if db.query(Agenda).filter(Agenda.alias_name == agenda.alias_name).first():
         raise HTTPException(status_code=400, detail="Alias name already taken")
     db_agenda = Agenda(
@@ -32,63 +41,81 @@ def create_agenda(agenda: AgendaCreate, db: Session = Depends(get_db), current_u
     return db_agenda
 
 @router.get("/", response_model=List[AgendaResponse])
-def list_agendas(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(Agenda).filter(Agenda.user_id == current_user.id).all()
+def list_agendas(db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
+    return rows_response(db.query(*AGENDA_COLUMNS).filter(Agenda.user_id == current_user.id).all(), AgendaResponse)
+
+@router.put("/{agenda_id}", response_model=AgendaResponse)
+def update_agenda(agenda_id: int, update: AgendaUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
+    db_agenda = db.query(Agenda).filter(Agenda.id == agenda_id, Agenda.user_id == current_user.id).first()
+    if not db_agenda:
+        raise HTTPException(status_code=404, detail="Agenda not found")
+    if update.alias_name and update.alias_name != db_agenda.alias_name:
+        if db.query(Agenda).filter(Agenda.alias_name == update.alias_name).first():
+            raise HTTPException(status_code=400, detail="Alias name already taken")
+    old_alias = db_agenda.alias_name
+    for field, value in update.dict(exclude_unset=True).items():
+        if value is not None:
+            setattr(db_agenda, field, value)
+    if db_agenda.alias_name != old_alias:
+        # The alias appears in every event of the user's feed
+        db.execute(bump_feed_version(agenda_id))
+        db.execute(bump_user_feed_version(agenda_id))
+    db.commit()
+    invalidate_agenda(old_alias, agenda_id)
+    invalidate_agenda(db_agenda.alias_name)
+    invalidate_feeds(current_user.id)
+    db.refresh(db_agenda)
+    return db_agenda
 
 @router.get("/public/{alias_name}", response_model=AgendaResponse)
-def get_public_agenda(alias_name: str, db: Session = Depends(get_db)):
-    agenda = db.query(Agenda).filter(Agenda.alias_name == alias_name, Agenda.is_active == True).first()
+def get_public_agenda(alias_name: str, db: Session = Depends(get_read_db)):
+    agenda = get_active_agenda(db, alias_name)
     if not agenda:
         raise HTTPException(status_code=404, detail="Agenda not found")
     return agenda
 
 @router.get("/public/{alias_name}/slots")
-def get_available_slots(alias_name: str, db: Session = Depends(get_db)):
-    # Stub: Return next 7 days, 9am-5pm, slot_duration from agenda
-    agenda = db.query(Agenda).filter(Agenda.alias_name == alias_name, Agenda.is_active == True).first()
+async def get_available_slots(alias_name: str, days: int = Query(DEFAULT_HORIZON_DAYS, ge=1, le=MAX_HORIZON_DAYS), db: AsyncSession = Depends(get_async_read_db)):
+    agenda = await db.run_sync(get_active_agenda, alias_name)
     if not agenda:
         raise HTTPException(status_code=404, detail="Agenda not found")
-    now = datetime.utcnow()
-    slots = []
-    for day in range(7):
-        date = now + timedelta(days=day)
-        start = datetime(date.year, date.month, date.day, 9, 0)
-        end = datetime(date.year, date.month, date.day, 17, 0)
-        slot = start
-        while slot + timedelta(minutes=agenda.slot_duration) <= end:
-            slot_end = slot + timedelta(minutes=agenda.slot_duration)
-            # Check for conflicts
-            conflict = db.query(Meeting).filter(Meeting.agenda_id == agenda.id, Meeting.start_time < slot_end, Meeting.end_time > slot).first()
-            if not conflict:
-                slots.append({"start_time": slot, "end_time": slot_end})
-            slot = slot_end
-    return slots
+    # Owner availability in their timezone minus one meetings query for the whole horizon.
+    # orjson serialises the datetimes itself, so the list skips jsonable_encoder
+    return ORJSONResponse(await db.run_sync(compute_available_slots, agenda, days))
 
-@router.post("/public/{alias_name}/book", response_model=MeetingResponse)
-def book_meeting(alias_name: str, meeting: MeetingCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), request: Request = None):
-    agenda = db.query(Agenda).filter(Agenda.alias_name == alias_name, Agenda.is_active == True).first()
+@router.get("/public/{alias_name}/events")
+async def get_slot_events(alias_name: str):
+    # Server-sent slot_taken deltas (and resync when a client falls behind). Open the stream, then
+    # fetch /slots once. No session dependency: it would stay checked out for as long as the client listens.
+    async with AsyncSessionLocal() as db:
+        agenda = await db.run_sync(get_active_agenda, alias_name)
     if not agenda:
         raise HTTPException(status_code=404, detail="Agenda not found")
-    # Enforce max bookings per visitor
-    count = db.query(Meeting).filter(Meeting.agenda_id == agenda.id, Meeting.visitor_email == meeting.visitor_email).count()
-    if count >= MAX_BOOKINGS_PER_VISITOR:
-        raise HTTPException(status_code=400, detail="Booking limit reached for this agenda")
-    # Check for slot conflict
-    conflict = db.query(Meeting).filter(Meeting.agenda_id == agenda.id, Meeting.start_time < meeting.end_time, Meeting.end_time > meeting.start_time).first()
-    if conflict:
-        raise HTTPException(status_code=400, detail="Slot already booked")
-    db_meeting = Meeting(
-        agenda_id=agenda.id,
-        visitor_email=meeting.visitor_email,
-        start_time=meeting.start_time,
-        end_time=meeting.end_time,
-        status="booked"
+    return StreamingResponse(
+        sse_stream(alias_name), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    db.add(db_meeting)
-    db.commit()
-    db.refresh(db_meeting)
-    # Send confirmation email (reuse send_reset_email for demo)
+
+@router.post("/public/{alias_name}/book", response_model=MeetingResponse)
+async def book_meeting(alias_name: str, meeting: MeetingCreate, response: Response, db: AsyncSession = Depends(get_async_db), request: Request = None):
+    agenda = await db.run_sync(get_active_agenda, alias_name)
+    if not agenda:
+        raise HTTPException(status_code=404, detail="Agenda not found")
     base_url = str(request.base_url) if request else "http://localhost:8000/"
     msg = f"Your meeting is booked for {meeting.start_time} - {meeting.end_time} on {base_url}smartcal.one/{alias_name}"
-    send_reset_email(background_tasks, meeting.visitor_email, msg)
-    return db_meeting 
\ No newline at end of file
+
+    def enqueue_confirmation(db, db_meeting):
+        # The confirmation goes into the outbox in the same transaction as the meeting
+        enqueue_email(db, meeting.booked_by_email, "Meeting Confirmation", msg)
+
+    # Conflict and per-visitor checks happen inside the insert itself, so concurrent requests cannot double-book
+    try:
+        db_meeting = await book_atomically(db, agenda.id, meeting, MAX_BOOKINGS_PER_VISITOR, enqueue_confirmation)
+    except BookingRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BookingContention:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    invalidate_agenda_slots(agenda.id)
+    invalidate_feeds(agenda.user_id, alias_name)
+    slot_events.publish(alias_name, SLOT_TAKEN, db_meeting.start_time, db_meeting.end_time)
+    pin_to_primary(response)
+    return db_meeting
@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from app.models.availability import AvailabilitySlot
 from app.schemas.availability import AvailabilitySlotCreate, AvailabilitySlotUpdate, AvailabilitySlotResponse
-from app.utils import get_db, get_current_user
-from app.models.user import User
+from app.utils import get_db, get_current_principal, Principal
+from app.async_db import get_async_db
+from app.bulk import bulk_format, import_records, insert_chunk, export_response
+from app.slots import invalidate_user_availability
+from app.responses import schema_columns, rows_response
 
 router = APIRouter()
 
+SLOT_COLUMNS = schema_columns(AvailabilitySlot, AvailabilitySlotResponse)
+
 @router.post("/slots", response_model=AvailabilitySlotResponse)
-def add_slot(slot: AvailabilitySlotCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def add_slot(slot: AvailabilitySlotCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     db_slot = AvailabilitySlot(
         user_id=current_user.id,
         day_of_week=slot.day_of_week,
@@ -18,29 +25,52 @@ def add_slot(slot: AvailabilitySlotCreate, db: Session = Depends(get_db), curren
     )
     db.add(db_slot)
     db.commit()
+    invalidate_user_availability(current_user.id)
     db.refresh(db_slot)
     return db_slot
 
 @router.get("/slots", response_model=List[AvailabilitySlotResponse])
-def get_my_slots(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(AvailabilitySlot).filter(AvailabilitySlot.user_id == current_user.id).all()
+def get_my_slots(db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
+    return rows_response(db.query(*SLOT_COLUMNS).filter(AvailabilitySlot.user_id == current_user.id).all(), AvailabilitySlotResponse)
 
 @router.put("/slots/{slot_id}", response_model=AvailabilitySlotResponse)
-def update_slot(slot_id: int, slot_update: AvailabilitySlotUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_slot(slot_id: int, slot_update: AvailabilitySlotUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     db_slot = db.query(AvailabilitySlot).filter(AvailabilitySlot.id == slot_id, AvailabilitySlot.user_id == current_user.id).first()
     if not db_slot:
         raise HTTPException(status_code=404, detail="Slot not found")
     for field, value in slot_update.dict(exclude_unset=True).items():
         setattr(db_slot, field, value)
     db.commit()
+    invalidate_user_availability(current_user.id)
     db.refresh(db_slot)
     return db_slot
 
 @router.delete("/slots/{slot_id}", status_code=204)
-def delete_slot(slot_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_slot(slot_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     db_slot = db.query(AvailabilitySlot).filter(AvailabilitySlot.id == slot_id, AvailabilitySlot.user_id == current_user.id).first()
     if not db_slot:
         raise HTTPException(status_code=404, detail="Slot not found")
     db.delete(db_slot)
     db.commit()
-    return None 
\ No newline at end of file
+    invalidate_user_availability(current_user.id)
+    return None
+
+@router.post("/slots/import")
+async def import_slots(request: Request, format: Optional[str] = None, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_principal)):
+    fmt = bulk_format(request, format)
+    try:
+        return await import_records(
+            request, fmt, AvailabilitySlotCreate,
+            lambda slot: {"user_id": current_user.id, **slot.dict()},
+            insert_chunk(db, AvailabilitySlot),
+        )
+    finally:
+        invalidate_user_availability(current_user.id)
+
+@router.get("/slots/export")
+def export_slots(request: Request, format: Optional[str] = None, current_user: Principal = Depends(get_current_principal)):
+    columns = ("id", "day_of_week", "start_time", "end_time")
+    query = select(*(getattr(AvailabilitySlot, name) for name in columns)).where(
+        AvailabilitySlot.user_id == current_user.id
+    ).order_by(AvailabilitySlot.id)
+    return export_response(query, columns, bulk_format(request, format), "availability_slots")
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select, insert, update, func
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from app.models.calendar import Calendar
 from app.schemas.calendar import CalendarCreate, CalendarUpdate, CalendarResponse
-from app.utils import get_db, get_current_user
-from app.models.user import User
+from app.utils import get_db, get_current_principal, Principal
+from app.async_db import get_async_db
+from app.bulk import bulk_format, import_records, export_response
+from app.responses import schema_columns, rows_response
 
 router = APIRouter()
 
+CALENDAR_COLUMNS = schema_columns(Calendar, CalendarResponse)
+
 @router.post("/", response_model=CalendarResponse)
-def create_calendar(calendar: CalendarCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_calendar(calendar: CalendarCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     if calendar.is_primary:
         # Unset other primary calendars for this user
         db.query(Calendar).filter(Calendar.user_id == current_user.id, Calendar.is_primary == True).update({Calendar.is_primary: False})
@@ -19,7 +25,10 @@ def create_calendar(calendar: CalendarCreate, db: Session = Depends(get_db), cur
     db_calendar = Calendar(
         user_id=current_user.id,
         alias=calendar.alias,
-        is_primary=calendar.is_primary or False
+        is_primary=calendar.is_primary or False,
+        sync_direction=calendar.sync_direction or "one-way",
+        subject_prefix=calendar.subject_prefix,
+        external_id=calendar.external_id
     )
     db.add(db_calendar)
     db.commit()
@@ -27,11 +36,11 @@ def create_calendar(calendar: CalendarCreate, db: Session = Depends(get_db), cur
     return db_calendar
 
 @router.get("/", response_model=List[CalendarResponse])
-def list_calendars(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(Calendar).filter(Calendar.user_id == current_user.id).all()
+def list_calendars(db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
+    return rows_response(db.query(*CALENDAR_COLUMNS).filter(Calendar.user_id == current_user.id).all(), CalendarResponse)
 
 @router.put("/{calendar_id}", response_model=CalendarResponse)
-def update_calendar(calendar_id: int, update: CalendarUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_calendar(calendar_id: int, update: CalendarUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     db_calendar = db.query(Calendar).filter(Calendar.id == calendar_id, Calendar.user_id == current_user.id).first()
     if not db_calendar:
         raise HTTPException(status_code=404, detail="Calendar not found")
@@ -40,6 +49,51 @@ def update_calendar(calendar_id: int, update: CalendarUpdate, db: Session = Depe
         db_calendar.is_primary = True
     if update.alias:
         db_calendar.alias = update.alias
+    if update.sync_direction:
+        db_calendar.sync_direction = update.sync_direction
+    if update.subject_prefix is not None:
+        db_calendar.subject_prefix = update.subject_prefix or None
+    if update.external_id is not None and update.external_id != db_calendar.external_id:
+        # A different provider calendar: its sync token means nothing, start over
+        db_calendar.external_id = update.external_id or None
+        db_calendar.sync_token = None
+        db_calendar.sync_cursor = None
     db.commit()
     db.refresh(db_calendar)
-    return db_calendar 
\ No newline at end of file
+    return db_calendar
+
+@router.post("/import")
+async def import_calendars(request: Request, format: Optional[str] = None, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_principal)):
+    def to_row(calendar: CalendarCreate):
+        return {
+            "user_id": current_user.id,
+            "alias": calendar.alias,
+            "is_primary": bool(calendar.is_primary),
+            "sync_direction": calendar.sync_direction or "one-way",
+            "subject_prefix": calendar.subject_prefix,
+            "external_id": calendar.external_id,
+        }
+
+    async def write_chunk(rows):
+        # Same rule as create_calendar: a new primary replaces the old one, so only the last one in a chunk wins
+        primaries = [row for row in rows if row["is_primary"]]
+        if primaries:
+            for row in primaries[:-1]:
+                row["is_primary"] = False
+            await db.execute(update(Calendar).where(Calendar.user_id == current_user.id, Calendar.is_primary == True).values(is_primary=False))
+        await db.execute(insert(Calendar), rows)
+        await db.commit()
+
+    report = await import_records(request, bulk_format(request, format), CalendarCreate, to_row, write_chunk)
+    if report["imported"] and not await db.scalar(select(Calendar.id).where(Calendar.user_id == current_user.id, Calendar.is_primary == True).limit(1)):
+        # If no primary exists, the oldest calendar becomes primary
+        first_id = await db.scalar(select(func.min(Calendar.id)).where(Calendar.user_id == current_user.id))
+        await db.execute(update(Calendar).where(Calendar.id == first_id).values(is_primary=True))
+        await db.commit()
+    return report
+
+@router.get("/export")
+def export_calendars(request: Request, format: Optional[str] = None, current_user: Principal = Depends(get_current_principal)):
+    columns = ("id", "alias", "is_primary", "sync_direction", "subject_prefix", "external_id")
+    query = select(*(getattr(Calendar, name) for name in columns)).where(Calendar.user_id == current_user.id).order_by(Calendar.id)
+    return export_response(query, columns, bulk_format(request, format), "calendars")
@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.models.agenda import Agenda
+from app.cache import feed_cache
+from app.utils import get_db, get_current_principal, Principal, create_feed_token, verify_feed_token
+from app.feeds import agenda_feed_state, user_feed_state, feed_token_version, rotate_feed_token, feed_window_start, feed_validators, http_date, is_not_modified, render_feed
+
+router = APIRouter()
+
+def _feed_urls(request: Request, db: Session, user_id: int, version: int):
+    token = create_feed_token(user_id, version)
+    base_url = f"{request.base_url}feeds"
+    aliases = [alias for (alias,) in db.query(Agenda.alias_name).filter(Agenda.user_id == user_id).order_by(Agenda.id)]
+    return {
+        "token": token,
+        "user": f"{base_url}/user.ics?token={token}",
+        "agendas": {alias: f"{base_url}/agendas/{alias}.ics?token={token}" for alias in aliases},
+    }
+
+@router.get("/token")
+def get_feed_urls(request: Request, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
+    # Subscription URLs for calendar apps; anyone holding one can read the feed until it is rotated
+    return _feed_urls(request, db, current_user.id, feed_token_version(db, current_user.id))
+
+@router.post("/token/rotate")
+def rotate_feed_urls(request: Request, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
+    # Revokes every feed URL handed out so far and returns new ones
+    version = rotate_feed_token(db, current_user.id)
+    db.commit()
+    feed_cache.pop(("token", current_user.id))
+    return _feed_urls(request, db, current_user.id, version)
+
+def _feed_owner(db: Session, token: str):
+    claims = verify_feed_token(token)
+    if claims is None or feed_token_version(db, claims[0]) != claims[1]:
+        raise HTTPException(status_code=404, detail="Feed not found")
+    return claims[0]
+
+def _feed_response(request: Request, state, name: str):
+    window_start = feed_window_start()
+    etag, last_modified = feed_validators(state, window_start)
+    headers = {"ETag": etag, "Last-Modified": http_date(last_modified), "Cache-Control": "private, no-cache"}
+    if is_not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since"), etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return StreamingResponse(
+        render_feed(state, name, window_start, last_modified),
+        media_type="text/calendar; charset=utf-8",
+        headers={**headers, "Content-Disposition": f'inline; filename="{name}.ics"'},
+    )
+
+# get_db only checks out a connection on first use, so a 304 answered from feed_cache never touches the database
+
+@router.get("/user.ics")
+def get_user_feed(token: str, request: Request, db: Session = Depends(get_db)):
+    user_id = _feed_owner(db, token)
+    return _feed_response(request, user_feed_state(db, user_id), "smartcal")
+
+@router.get("/agendas/{alias_name}.ics")
+def get_agenda_feed(alias_name: str, token: str, request: Request, db: Session = Depends(get_db)):
+    user_id = _feed_owner(db, token)
+    state = agenda_feed_state(db, alias_name)
+    if state is None or state.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Feed not found")
+    return _feed_response(request, state, alias_name)
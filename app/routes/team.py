@@ -1,19 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from sqlalchemy import insert, or_, select
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from app.models.team import Team, TeamMember
 from app.models.user import User
 from app.models.meeting import Meeting
-from app.schemas.team import TeamCreate, TeamUpdate, TeamResponse
+from app.schemas.team import TeamCreate, TeamUpdate, TeamResponse, TeamMemberBase
 from app.schemas.meeting import MeetingCreate, MeetingResponse
-from app.utils import get_db, get_current_user
+from app.utils import get_db, get_current_principal, Principal
+from app.async_db import get_async_db
+from app.bulk import bulk_format, import_records, insert_chunk, export_response
 from app.models.agenda import Agenda
-from datetime import datetime, timedelta
+from app.cache import invalidate_agenda_slots, invalidate_feeds
+from app.feeds import bump_feed_version, bump_user_feed_version
+from app.booking import run_locked, BookingRejected, BookingContention
+from app.slot_events import slot_events, SLOT_TAKEN
+from app.slots import get_users_availability, common_free_slots, BUCKET_MINUTES, DEFAULT_HORIZON_DAYS, MAX_HORIZON_DAYS
+from datetime import datetime, timedelta, date
+from collections import defaultdict
 
 router = APIRouter()
 
 @router.post("/", response_model=TeamResponse)
-def create_team(team: TeamCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_team(team: TeamCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     db_team = Team(user_id=current_user.id, name=team.name)
     db.add(db_team)
     db.commit()
@@ -25,7 +35,7 @@ def create_team(team: TeamCreate, db: Session = Depends(get_db), current_user: U
     return TeamResponse(id=db_team.id, name=db_team.name, members=team.members)
 
 @router.put("/{team_id}", response_model=TeamResponse)
-def update_team(team_id: int, update: TeamUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_team(team_id: int, update: TeamUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     db_team = db.query(Team).filter(Team.id == team_id, Team.user_id == current_user.id).first()
     if not db_team:
         raise HTTPException(status_code=404, detail="Team not found")
@@ -40,39 +50,147 @@ def update_team(team_id: int, update: TeamUpdate, db: Session = Depends(get_db),
     members = [m.email for m in db.query(TeamMember).filter(TeamMember.team_id == team_id).all()]
     return TeamResponse(id=db_team.id, name=db_team.name, members=members)
 
-@router.post("/meetings", response_model=List[MeetingResponse])
-def create_team_meeting(meeting: MeetingCreate, team_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+@router.post("/{team_id}/members/import")
+async def import_team_members(team_id: int, request: Request, format: Optional[str] = None, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_principal)):
+    if not await db.scalar(select(Team.id).where(Team.id == team_id, Team.user_id == current_user.id)):
+        raise HTTPException(status_code=404, detail="Team not found")
+    return await import_records(
+        request, bulk_format(request, format), TeamMemberBase,
+        lambda member: {"team_id": team_id, "email": member.email},
+        insert_chunk(db, TeamMember),
+    )
+
+@router.get("/{team_id}/members/export")
+def export_team_members(team_id: int, request: Request, format: Optional[str] = None, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
+    if not db.query(Team.id).filter(Team.id == team_id, Team.user_id == current_user.id).first():
+        raise HTTPException(status_code=404, detail="Team not found")
+    columns = ("id", "email")
+    query = select(TeamMember.id, TeamMember.email).where(TeamMember.team_id == team_id).order_by(TeamMember.id)
+    return export_response(query, columns, bulk_format(request, format), f"team_{team_id}_members")
+
+@router.get("/{team_id}/free-slots")
+def get_team_free_slots(
+    team_id: int,
+    start: Optional[date] = None,
+    days: int = Query(DEFAULT_HORIZON_DAYS, ge=1, le=MAX_HORIZON_DAYS),
+    duration: int = Query(30, ge=BUCKET_MINUTES, le=8 * 60),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+):
     db_team = db.query(Team).filter(Team.id == team_id, Team.user_id == current_user.id).first()
     if not db_team:
         raise HTTPException(status_code=404, detail="Team not found")
-    # Check availability for all members (stub: always available)
-    responses = []
-    for member in db_team.members:
-        is_external = db.query(User).filter(User.email == member.email).first() is None
-        db_meeting = Meeting(
+    emails = [email for (email,) in db.query(TeamMember.email).filter(TeamMember.team_id == team_id)]
+    users = db.query(User.id, User.email, User.timezone).filter(User.email.in_(emails)).all() if emails else []
+    if not users:
+        raise HTTPException(status_code=400, detail="Team has no internal members to schedule")
+    now = datetime.utcnow()
+    range_start = datetime.combine(start, datetime.min.time()) if start else now
+    # Align to the bucket grid and never offer times in the past
+    range_start = max(range_start, now)
+    past_grid = timedelta(minutes=range_start.minute % BUCKET_MINUTES, seconds=range_start.second, microseconds=range_start.microsecond)
+    if past_grid:
+        range_start += timedelta(minutes=BUCKET_MINUTES) - past_grid
+    # The horizon counts from the clamped start, so a start date in the past still gets `days` days
+    range_end = datetime.combine(range_start.date() + timedelta(days=days), datetime.min.time())
+    if range_end <= range_start:
+        return []
+    # Three queries for the whole team: users (above), availability masks, overlapping meetings
+    availability = get_users_availability(db, {user_id: timezone for user_id, _, timezone in users})
+    user_by_email = {email: user_id for user_id, email, _ in users}
+    busy = defaultdict(list)
+    meetings = db.query(Meeting.start_time, Meeting.end_time, Meeting.booked_by_email, Agenda.user_id).join(Agenda, Meeting.agenda_id == Agenda.id).filter(
+        or_(Agenda.user_id.in_(user_by_email.values()), Meeting.booked_by_email.in_(user_by_email.keys())),
+        Meeting.start_time < range_end,
+        Meeting.end_time > range_start,
+    ).all()
+    for start_time, end_time, email, owner_id in meetings:
+        if owner_id in availability:
+            busy[owner_id].append((start_time, end_time))
+        if email in user_by_email and user_by_email[email] != owner_id:
+            busy[user_by_email[email]].append((start_time, end_time))
+    members = [(mask, tz, busy[user_id]) for user_id, (mask, tz) in availability.items()]
+    return common_free_slots(members, range_start, range_end, duration, limit)
+
+@router.post("/meetings", response_model=List[MeetingResponse])
+async def create_team_meeting(meeting: MeetingCreate, team_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_principal)):
+    if await db.scalar(select(Team.id).where(Team.id == team_id, Team.user_id == current_user.id)) is None:
+        raise HTTPException(status_code=404, detail="Team not found")
+    # Team meetings go on one of the organiser's own agendas
+    if await db.scalar(select(Agenda.id).where(Agenda.id == meeting.agenda_id, Agenda.user_id == current_user.id)) is None:
+        raise HTTPException(status_code=404, detail="Agenda not found")
+    emails = list(await db.scalars(select(TeamMember.email).where(TeamMember.team_id == team_id).order_by(TeamMember.id)))
+    if not emails:
+        return []
+    # One lookup decides internal vs external for every member
+    internal = dict((await db.execute(select(User.id, User.email).where(User.email.in_(emails)))).all())
+    internal_emails = set(internal.values())
+    # On PostgreSQL every agenda the conflict check reads is locked, as a public booking on it would be
+    agenda_ids = [meeting.agenda_id]
+    if internal:
+        agenda_ids += await db.scalars(select(Agenda.id).where(Agenda.user_id.in_(internal.keys())))
+    rows = [
+        dict(
             agenda_id=meeting.agenda_id,
             start_time=meeting.start_time,
             end_time=meeting.end_time,
-            booked_by_email=member.email,
+            booked_by_email=email,
             meeting_type=meeting.meeting_type,
             travel_time_before=meeting.travel_time_before,
             travel_time_after=meeting.travel_time_after,
             virtual_app=meeting.virtual_app,
             status="booked"
         )
-        db.add(db_meeting)
-        db.commit()
-        db.refresh(db_meeting)
+        for email in emails
+    ]
+
+    async def book():
+        # The conflict check and the insert share one write transaction, so two concurrent team meetings
+        # cannot both find the members free
+        if internal:
+            # Internal members are busy if a meeting on one of their agendas, or one booked for them, overlaps
+            conflicts = (await db.execute(
+                select(Meeting.booked_by_email, Agenda.user_id).join(Agenda, Meeting.agenda_id == Agenda.id).where(
+                    or_(Agenda.user_id.in_(internal.keys()), Meeting.booked_by_email.in_(internal_emails)),
+                    Meeting.start_time < meeting.end_time,
+                    Meeting.end_time > meeting.start_time,
+                )
+            )).all()
+            busy = {internal[user_id] for _, user_id in conflicts if user_id in internal}
+            busy.update(email for email, _ in conflicts if email in internal_emails)
+            if busy:
+                raise BookingRejected(f"Members not available: {', '.join(sorted(busy))}")
+        # Multi-row INSERT ... RETURNING; rows are matched back by email since RETURNING order is not guaranteed
+        ids_by_email = defaultdict(list)
+        for meeting_id, email in await db.execute(insert(Meeting).returning(Meeting.id, Meeting.booked_by_email), rows):
+            ids_by_email[email].append(meeting_id)
+        feed_owner = (await db.execute(bump_feed_version(meeting.agenda_id))).first()
+        await db.execute(bump_user_feed_version(meeting.agenda_id))
+        return ids_by_email, feed_owner
+
+    try:
+        ids_by_email, feed_owner = await run_locked(db, agenda_ids, book)
+    except BookingRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BookingContention:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    invalidate_agenda_slots(meeting.agenda_id)
+    if feed_owner is not None:
+        invalidate_feeds(*feed_owner)
+        slot_events.publish(feed_owner.alias_name, SLOT_TAKEN, meeting.start_time, meeting.end_time)
+    responses = []
+    for email in emails:
         responses.append(MeetingResponse(
-            id=db_meeting.id,
-            start_time=db_meeting.start_time,
-            end_time=db_meeting.end_time,
-            booked_by_email=db_meeting.booked_by_email,
-            meeting_type=db_meeting.meeting_type,
-            travel_time_before=db_meeting.travel_time_before,
-            travel_time_after=db_meeting.travel_time_after,
-            virtual_app=db_meeting.virtual_app,
-            status=db_meeting.status,
-            is_external=is_external
+            id=ids_by_email[email].pop(0),
+            start_time=meeting.start_time,
+            end_time=meeting.end_time,
+            booked_by_email=email,
+            meeting_type=meeting.meeting_type,
+            travel_time_before=meeting.travel_time_before,
+            travel_time_after=meeting.travel_time_after,
+            virtual_app=meeting.virtual_app,
+            status="booked",
+            is_external=email not in internal_emails
         ))
-    return responses 
\ No newline at end of file
+    return responses
@@ -1,21 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from app.schemas.user import UserCreate, UserLogin, UserResponse, UserUpdate, UserCreateByAdmin
 from app.models.user import User
-from app.utils import get_db, create_access_token, get_password_hash, verify_password, get_current_user, require_superadmin, send_reset_email, create_password_reset_token, verify_password_reset_token
+from app.async_db import get_async_db
+from app.utils import get_db, create_access_token, get_password_hash, verify_password, get_current_user, Principal, require_superadmin, invalidate_principal, send_reset_email, create_password_reset_token, verify_password_reset_token
+from app.slots import invalidate_user_availability
+from app.cache import cache_stats
+from app.daily_agenda import schedule_daily_agenda
+from app.bulk import bulk_format, export_response
 from pydantic import BaseModel
 from datetime import datetime
 
 router = APIRouter()
 
+# Columns an admin listing may select; password and OAuth tokens are never listed
+LIST_USER_FIELDS = (
+    "id", "name", "email", "alias", "image_url", "description", "role", "send_daily_agenda",
+    "agenda_send_time", "timezone", "provider", "token_expiry",
+)
+
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == user.email).first():
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    # Async so that the route awaits the hashing pool instead of holding a threadpool worker
+    if await db.scalar(select(User.id).where(User.email == user.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
-    if db.query(User).filter(User.alias == user.alias).first():
+    if await db.scalar(select(User.id).where(User.alias == user.alias)):
         raise HTTPException(status_code=400, detail="Alias already taken")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         name=user.name,
         email=user.email,
@@ -26,16 +41,16 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         role="user"
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or not verify_password(user.password, db_user.password):
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    db_user = (await db.execute(select(User.id, User.password).where(User.email == user.email))).first()
+    if not db_user or not await verify_password(user.password, db_user.password):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    access_token = create_access_token({"sub": db_user.id})
+    access_token = create_access_token({"sub": str(db_user.id)})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
@@ -45,14 +60,14 @@ def get_me(current_user: User = Depends(get_current_user)):
 # --- Superadmin Endpoints ---
 
 @router.post("/admin/create_user", response_model=UserResponse)
-def create_user_by_admin(user: UserCreateByAdmin, db: Session = Depends(get_db), current_user: User = Depends(require_superadmin)):
+async def create_user_by_admin(user: UserCreateByAdmin, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(require_superadmin)):
     if user.role not in ["user", "superadmin"]:
         raise HTTPException(status_code=400, detail="Invalid role")
-    if db.query(User).filter(User.email == user.email).first():
+    if await db.scalar(select(User.id).where(User.email == user.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
-    if db.query(User).filter(User.alias == user.alias).first():
+    if await db.scalar(select(User.id).where(User.alias == user.alias)):
         raise HTTPException(status_code=400, detail="Alias already taken")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         name=user.name,
         email=user.email,
@@ -63,16 +78,43 @@ def create_user_by_admin(user: UserCreateByAdmin, db: Session = Depends(get_db),
         role=user.role
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-@router.get("/admin/users", response_model=List[UserResponse])
-def list_users(db: Session = Depends(get_db), current_user: User = Depends(require_superadmin)):
-    return db.query(User).all()
+@router.get("/admin/users")
+def list_users(
+    request: Request,
+    after_id: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None,
+    format: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_superadmin),
+):
+    # Keyset pagination on id: pass the X-Next-Cursor header back as after_id for the next page.
+    # fields=id,email,... selects only those columns (id is always included).
+    # format=ndjson|csv streams every user after after_id instead of one page.
+    columns = ["id"]
+    for name in (fields.split(",") if fields else LIST_USER_FIELDS):
+        name = name.strip()
+        if name not in LIST_USER_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Unknown field: {name}")
+        if name not in columns:
+            columns.append(name)
+    query = select(*(getattr(User, name) for name in columns)).where(User.id > after_id).order_by(User.id)
+    if format is not None:
+        return export_response(query, columns, bulk_format(request, format), "users")
+    rows = db.execute(query.limit(limit)).all()
+    headers = {"X-Next-Cursor": str(rows[-1].id)} if len(rows) == limit else None
+    return ORJSONResponse([dict(zip(columns, row)) for row in rows], headers=headers)
+
+@router.get("/admin/cache-stats")
+def get_cache_stats(current_user: Principal = Depends(require_superadmin)):
+    return cache_stats()
 
 @router.put("/admin/users/{user_id}", response_model=UserResponse)
-def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get_db), current_user: User = Depends(require_superadmin)):
+def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(require_superadmin)):
     db_user = db.query(User).filter(User.id == user_id).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -80,10 +122,15 @@ def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get
         raise HTTPException(status_code=400, detail="Email already registered")
     if user_update.alias and db.query(User).filter(User.alias == user_update.alias, User.id != user_id).first():
         raise HTTPException(status_code=400, detail="Alias already taken")
-    for field, value in user_update.dict(exclude_unset=True).items():
+    changes = user_update.dict(exclude_unset=True)
+    for field, value in changes.items():
         if field != "password":
             setattr(db_user, field, value)
+    if changes.keys() & {"send_daily_agenda", "agenda_send_time", "timezone"}:
+        schedule_daily_agenda(db, db_user)
     db.commit()
+    invalidate_user_availability(user_id)
+    invalidate_principal(user_id)
     db.refresh(db_user)
     return db_user 
 
@@ -95,26 +142,28 @@ class PasswordResetConfirm(BaseModel):
     new_password: str
 
 @router.post("/password-reset-request")
-def password_reset_request(data: PasswordResetRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db), request: Request = None):
+def password_reset_request(data: PasswordResetRequest, db: Session = Depends(get_db), request: Request = None):
     user = db.query(User).filter(User.email == data.email).first()
     if not user:
         return {"message": "If the email exists, a reset link will be sent."}
     token = create_password_reset_token(user.id)
     base_url = str(request.base_url) if request else "http://localhost:8000/"
     reset_link = f"{base_url}users/password-reset?token={token}"
-    send_reset_email(background_tasks, user.email, reset_link)
+    send_reset_email(db, user.email, reset_link)
+    db.commit()
     return {"message": "If the email exists, a reset link will be sent."}
 
 @router.post("/password-reset")
-def password_reset(data: PasswordResetConfirm, db: Session = Depends(get_db)):
+async def password_reset(data: PasswordResetConfirm, db: AsyncSession = Depends(get_async_db)):
     user_id = verify_password_reset_token(data.token)
     if not user_id:
         raise HTTPException(status_code=400, detail="Invalid or expired token")
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    user.password = get_password_hash(data.new_password)
-    db.commit()
+    user.password = await get_password_hash(data.new_password)
+    await db.commit()
+    invalidate_principal(user.id)
     return {"message": "Password reset successful"} 
 
 class OAuth2TokenRequest(BaseModel):
@@ -130,5 +179,6 @@ def store_oauth2_token(data: OAuth2TokenRequest, db: Session = Depends(get_db),
     current_user.access_token = data.access_token
     current_user.token_expiry = data.token_expiry
     db.commit()
+    invalidate_principal(current_user.id)
     db.refresh(current_user)
     return {"message": "OAuth2 tokens updated"} 
\ No newline at end of file
@@ -5,6 +5,7 @@ class CalendarBase(BaseModel):
     alias: str
     sync_direction: Optional[str] = "one-way"
     subject_prefix: Optional[str] = None
+    external_id: Optional[str] = None
 
 class CalendarCreate(CalendarBase):
     is_primary: Optional[bool] = False
@@ -16,6 +17,7 @@ class CalendarUpdate(BaseModel):
     is_primary: Optional[bool] = None
     sync_direction: Optional[str] = None
     subject_prefix: Optional[str] = None
+    external_id: Optional[str] = None
 
 class CalendarResponse(CalendarBase):
     id: int
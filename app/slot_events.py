@@ -0,0 +1,181 @@
+from collections import defaultdict
+from datetime import datetime
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Push of slot changes to visitors on a public agenda page (GET /agendas/public/{alias}/events), so they
+# do not have to re-poll the slots endpoint. Messages go through a broker: "memory" reaches subscribers in
+# this process only, "sqlite" shares them between worker processes through one SQLite file.
+SLOT_EVENTS_BROKER = os.getenv("SLOT_EVENTS_BROKER", "memory")
+SLOT_EVENTS_DB = os.getenv("SLOT_EVENTS_DB", "./slot_events.db")
+SLOT_EVENTS_QUEUE_SIZE = int(os.getenv("SLOT_EVENTS_QUEUE_SIZE", 64))
+SLOT_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("SLOT_EVENTS_HEARTBEAT_SECONDS", 15))
+SLOT_EVENTS_POLL_SECONDS = float(os.getenv("SLOT_EVENTS_POLL_SECONDS", 0.2))
+
+# Meetings are never deleted or cancelled through the API yet, so slots are only ever taken
+SLOT_TAKEN = "slot_taken"
+# Sent instead of the deltas a subscriber was too slow to take; the client should refetch the slots
+RESYNC = "resync"
+
+logger = logging.getLogger("smartcal.slot_events")
+
+class MemoryBroker:
+    def __init__(self):
+        self._loop = None
+        self._deliver = None
+
+    def start(self, loop, deliver):
+        # deliver(channel, message) is always called on `loop`
+        self._loop = loop
+        self._deliver = deliver
+
+    def publish(self, channel: str, message: dict):
+        # Safe from the event loop and from threadpool routes alike
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, channel, message)
+
+class SQLiteBroker:
+    # Every process appends to one table and tails it from a polling thread; rows are pruned after a minute
+    RETAIN_SECONDS = 60
+
+    def __init__(self, path: str, poll_seconds: float = SLOT_EVENTS_POLL_SECONDS):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self._conn = self._connect()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS slot_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, message TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._thread = None
+        # publish is called from the event loop, so the INSERTs happen on a writer thread that owns self._conn
+        self._pending = queue.SimpleQueue()
+        threading.Thread(target=self._write, name="slot-events-writer", daemon=True).start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Events are disposable, no need to fsync them
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def start(self, loop, deliver):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._tail, args=(loop, deliver), name="slot-events", daemon=True)
+        self._thread.start()
+
+    def publish(self, channel: str, message: dict):
+        # Never waits on the database
+        self._pending.put((channel, json.dumps(message), time.time()))
+
+    def _write(self):
+        # Everything queued since the last write goes in as one transaction
+        while True:
+            rows = [self._pending.get()]
+            while True:
+                try:
+                    rows.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT INTO slot_events (channel, message, created) VALUES (?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.warning("Publishing %d slot events failed: %r", len(rows), e)
+
+    def _tail(self, loop, deliver):
+        conn = self._connect()
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM slot_events").fetchone()[0]
+        last_prune = 0.0
+        while not loop.is_closed():
+            try:
+                rows = conn.execute("SELECT id, channel, message FROM slot_events WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+                for last_id, channel, message in rows:
+                    loop.call_soon_threadsafe(deliver, channel, json.loads(message))
+                now = time.time()
+                if now - last_prune > self.RETAIN_SECONDS:
+                    conn.execute("DELETE FROM slot_events WHERE created < ?", (now - self.RETAIN_SECONDS,))
+                    last_prune = now
+            except sqlite3.Error as e:
+                logger.warning("Reading slot events failed: %r", e)
+            except RuntimeError:
+                break  # loop closed between the check and call_soon_threadsafe
+            time.sleep(self.poll_seconds)
+        conn.close()
+
+def create_broker(name: str, sqlite_path: str = SLOT_EVENTS_DB):
+    if name == "memory":
+        return MemoryBroker()
+    if name == "sqlite":
+        return SQLiteBroker(sqlite_path)
+    raise ValueError(f"Unknown slot events broker: {name}")
+
+class SlotEventHub:
+    # Fans broker messages out to this process's subscribers, one bounded queue per client.
+    # Subscribers live on the event loop; publish may be called from any thread.
+    def __init__(self, broker, queue_size: int = SLOT_EVENTS_QUEUE_SIZE):
+        self.broker = broker
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, alias_name: str) -> asyncio.Queue:
+        self.broker.start(asyncio.get_running_loop(), self._deliver)
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers[alias_name].add(queue)
+        return queue
+
+    def unsubscribe(self, alias_name: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(alias_name)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[alias_name]
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, alias_name: str, kind: str, start_time: datetime, end_time: datetime):
+        self.broker.publish(alias_name, {"type": kind, "start_time": start_time.isoformat(), "end_time": end_time.isoformat()})
+
+    def _deliver(self, alias_name: str, message: dict):
+        for queue in self._subscribers.get(alias_name, ()):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A slow client never holds up the others: its backlog is replaced by a single resync
+                self.dropped += 1
+                while not queue.empty():
+                    if queue.get_nowait()["type"] != RESYNC:
+                        self.dropped += 1
+                queue.put_nowait({"type": RESYNC})
+
+slot_events = SlotEventHub(create_broker(SLOT_EVENTS_BROKER))
+
+def format_sse(message: dict) -> str:
+    return f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+async def sse_stream(alias_name: str):
+    # Subscribes only once the response starts, so a request that never streams leaves no queue behind.
+    # Comment lines keep proxies from closing an idle stream; Starlette cancels this when the client leaves.
+    queue = slot_events.subscribe(alias_name)
+    try:
+        yield ": subscribed\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), SLOT_EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(message)
+    finally:
+        slot_events.unsubscribe(alias_name, queue)
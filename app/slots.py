@@ -0,0 +1,249 @@
+from sqlalchemy.orm import Session
+from app.models.meeting import Meeting
+from app.models.availability import AvailabilitySlot
+from app.models.user import User
+from app.cache import availability_cache, slot_cache, invalidate_user_slots
+from datetime import datetime, timedelta
+import math
+import pytz
+
+DEFAULT_HORIZON_DAYS = 7
+MAX_HORIZON_DAYS = 60
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+DAY_BITS = (1 << MINUTES_PER_DAY) - 1
+
+def parse_hhmm(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def _range_bits(start: int, end: int) -> int:
+    # Minute range [start, end) of the week as a bitset, wrapping Sunday -> Monday
+    if end > MINUTES_PER_WEEK:
+        return _range_bits(start, MINUTES_PER_WEEK) | _range_bits(0, end - MINUTES_PER_WEEK)
+    return ((1 << (end - start)) - 1) << start
+
+def _bit_runs(bits: int):
+    # Contiguous runs of set bits as (start, end) offsets
+    runs = []
+    while bits:
+        low = bits & -bits
+        start = low.bit_length() - 1
+        carried = bits + low
+        end = (carried & -carried).bit_length() - 1
+        runs.append((start, end))
+        bits &= ~((1 << end) - 1)
+    return runs
+
+class AvailabilityMask:
+    # Weekly availability compiled to one bit per minute (bit 0 = Monday 00:00)
+    __slots__ = ("bits", "days")
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.days = tuple(
+            _bit_runs((bits >> (day * MINUTES_PER_DAY)) & DAY_BITS) for day in range(7)
+        )
+
+def compile_availability_mask(rows) -> AvailabilityMask:
+    bits = 0
+    for day_of_week, start_time, end_time in rows:
+        start = parse_hhmm(start_time)
+        end = parse_hhmm(end_time)
+        if end <= start:
+            # Slot runs past midnight into the next day
+            end += MINUTES_PER_DAY
+        offset = day_of_week * MINUTES_PER_DAY
+        bits |= _range_bits(offset + start, offset + end)
+    return AvailabilityMask(bits)
+
+# Used for owners that have not configured any availability: 09:00-17:00 every day
+DEFAULT_AVAILABILITY_MASK = compile_availability_mask([(day, "09:00", "17:00") for day in range(7)])
+
+def _compile_user_availability(rows, timezone_name):
+    mask = compile_availability_mask(rows) if rows else DEFAULT_AVAILABILITY_MASK
+    try:
+        tz = pytz.timezone(timezone_name) if timezone_name else pytz.utc
+    except pytz.UnknownTimeZoneError:
+        tz = pytz.utc
+    return mask, tz
+
+def get_user_availability(db: Session, user_id: int):
+    cached = availability_cache.get(user_id)
+    if cached is not None:
+        return cached
+    rows = db.query(AvailabilitySlot.day_of_week, AvailabilitySlot.start_time, AvailabilitySlot.end_time).filter(
+        AvailabilitySlot.user_id == user_id
+    ).all()
+    timezone_name = db.query(User.timezone).filter(User.id == user_id).scalar()
+    availability = _compile_user_availability(rows, timezone_name)
+    availability_cache.set(user_id, availability)
+    return availability
+
+def get_users_availability(db: Session, timezones):
+    # timezones: {user_id: timezone name}; cache misses are loaded with a single query
+    result = {}
+    missing = []
+    for user_id in timezones:
+        cached = availability_cache.get(user_id)
+        if cached is None:
+            missing.append(user_id)
+        else:
+            result[user_id] = cached
+    if missing:
+        rows_by_user = {user_id: [] for user_id in missing}
+        rows = db.query(
+            AvailabilitySlot.user_id, AvailabilitySlot.day_of_week, AvailabilitySlot.start_time, AvailabilitySlot.end_time
+        ).filter(AvailabilitySlot.user_id.in_(missing)).all()
+        for user_id, day_of_week, start_time, end_time in rows:
+            rows_by_user[user_id].append((day_of_week, start_time, end_time))
+        for user_id in missing:
+            availability = _compile_user_availability(rows_by_user[user_id], timezones[user_id])
+            availability_cache.set(user_id, availability)
+            result[user_id] = availability
+    return result
+
+def invalidate_user_availability(user_id: int):
+    availability_cache.pop(user_id)
+    invalidate_user_slots(user_id)
+
+def merge_intervals(intervals):
+    # Sort by start and collapse overlapping/touching intervals
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+def subtract_busy(candidates, busy):
+    # Sweep sorted candidate slots against merged busy intervals (both ascending)
+    free = []
+    i = 0
+    for candidate in candidates:
+        start, end = candidate[0], candidate[1]
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        if i < len(busy) and busy[i][0] < end:
+            continue
+        free.append(candidate)
+    return free
+
+def load_busy_intervals(db: Session, agenda_id: int, window_start: datetime, window_end: datetime):
+    rows = db.query(Meeting.start_time, Meeting.end_time).filter(
+        Meeting.agenda_id == agenda_id,
+        Meeting.start_time < window_end,
+        Meeting.end_time > window_start,
+    ).all()
+    return merge_intervals(rows)
+
+def _to_naive_utc(tz, local: datetime) -> datetime:
+    return tz.localize(local).astimezone(pytz.utc).replace(tzinfo=None)
+
+def expand_availability(mask: AvailabilityMask, tz, first_day, days: int):
+    # Availability windows for each local date as naive UTC (start, end) pairs
+    windows = []
+    for day in range(days):
+        date = first_day + timedelta(days=day)
+        midnight = datetime(date.year, date.month, date.day)
+        for start, end in mask.days[date.weekday()]:
+            windows.append((
+                _to_naive_utc(tz, midnight + timedelta(minutes=start)),
+                _to_naive_utc(tz, midnight + timedelta(minutes=end)),
+            ))
+    return windows
+
+def candidate_slots(windows, slot_duration: int):
+    step = timedelta(minutes=slot_duration)
+    candidates = []
+    for start, end in windows:
+        slot = start
+        while slot + step <= end:
+            candidates.append((slot, slot + step))
+            slot += step
+    return candidates
+
+def _compute_day_slots(db: Session, agenda, mask: AvailabilityMask, tz, dates):
+    # Free slots for each local date in `dates` (ascending) using a single meetings query
+    candidates = []
+    for date in dates:
+        for start, end in candidate_slots(expand_availability(mask, tz, date, 1), agenda.slot_duration):
+            candidates.append((start, end, date))
+    by_day = {date: [] for date in dates}
+    if candidates:
+        busy = load_busy_intervals(db, agenda.id, candidates[0][0], max(c[1] for c in candidates))
+        for start, end, date in subtract_busy(candidates, busy):
+            by_day[date].append({"start_time": start, "end_time": end})
+    return by_day
+
+def compute_available_slots(db: Session, agenda, days: int = DEFAULT_HORIZON_DAYS, now: datetime = None):
+    now = now or datetime.utcnow()
+    mask, tz = get_user_availability(db, agenda.user_id)
+    local_today = pytz.utc.localize(now).astimezone(tz).date()
+    dates = [local_today + timedelta(days=day) for day in range(days)]
+    by_day = {}
+    missing = []
+    for date in dates:
+        cached = slot_cache.get((agenda.user_id, agenda.id, date))
+        if cached is None:
+            missing.append(date)
+        else:
+            by_day[date] = cached
+    if missing:
+        computed = _compute_day_slots(db, agenda, mask, tz, missing)
+        for date, day_slots in computed.items():
+            slot_cache.set((agenda.user_id, agenda.id, date), day_slots)
+        by_day.update(computed)
+    slots = []
+    for date in dates:
+        slots.extend(slot for slot in by_day[date] if slot["start_time"] >= now)
+    return slots
+
+# Team free/busy works on 5-minute buckets: one bit per bucket across the whole range, per member
+BUCKET_MINUTES = 5
+
+def _bucket_bits(lo: int, hi: int, buckets: int) -> int:
+    # Buckets [lo, hi) of the range as a bitset; unlike _range_bits this never wraps, whatever the horizon
+    lo = min(max(lo, 0), buckets)
+    hi = min(max(hi, 0), buckets)
+    return ((1 << (hi - lo)) - 1) << lo if hi > lo else 0
+
+def _bucket(range_start: datetime, moment: datetime, round_up: bool, buckets: int) -> int:
+    offset = (moment - range_start).total_seconds() / (BUCKET_MINUTES * 60)
+    index = math.ceil(offset) if round_up else math.floor(offset)
+    return min(max(index, 0), buckets)
+
+def free_bits(mask: AvailabilityMask, tz, busy, range_start: datetime, range_end: datetime, buckets: int) -> int:
+    # Buckets fully inside an availability window and not touched by any busy interval
+    first_day = pytz.utc.localize(range_start).astimezone(tz).date() - timedelta(days=1)
+    last_day = pytz.utc.localize(range_end).astimezone(tz).date()
+    bits = 0
+    for start, end in expand_availability(mask, tz, first_day, (last_day - first_day).days + 1):
+        bits |= _bucket_bits(_bucket(range_start, start, True, buckets), _bucket(range_start, end, False, buckets), buckets)
+    for start, end in busy:
+        bits &= ~_bucket_bits(_bucket(range_start, start, False, buckets), _bucket(range_start, end, True, buckets), buckets)
+    return bits
+
+def common_free_slots(members, range_start: datetime, range_end: datetime, duration: int, limit: int):
+    # members: iterable of (AvailabilityMask, tzinfo, busy intervals); earliest `limit` slots free for all
+    buckets = int((range_end - range_start).total_seconds() // (BUCKET_MINUTES * 60))
+    if buckets <= 0:
+        return []
+    common = _bucket_bits(0, buckets, buckets)
+    for mask, tz, busy in members:
+        common &= free_bits(mask, tz, busy, range_start, range_end, buckets)
+        if not common:
+            return []
+    needed = math.ceil(duration / BUCKET_MINUTES)
+    step = timedelta(minutes=BUCKET_MINUTES)
+    slots = []
+    for lo, hi in _bit_runs(common):
+        while lo + needed <= hi and len(slots) < limit:
+            start = range_start + lo * step
+            slots.append({"start_time": start, "end_time": start + timedelta(minutes=duration)})
+            lo += needed
+        if len(slots) >= limit:
+            break
+    return slots
@@ -0,0 +1,181 @@
+from sqlalchemy import select, update
+from app.models.user import User
+from app.async_db import AsyncSessionLocal
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+import logging
+import os
+
+# OAuth2 access tokens for calendar providers: cached in memory, refreshed ahead of expiry in the
+# background, and refreshed at most once at a time per user however many callers need the token.
+TOKEN_REFRESH_AHEAD_SECONDS = float(os.getenv("TOKEN_REFRESH_AHEAD_SECONDS", 300))
+TOKEN_REFRESH_CONCURRENCY = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", 8))
+TOKEN_REFRESH_MAX_SLEEP = float(os.getenv("TOKEN_REFRESH_MAX_SLEEP", 60))
+
+logger = logging.getLogger("smartcal.tokens")
+
+CachedToken = namedtuple("CachedToken", ["access_token", "expires_at", "provider"])
+# What a token endpoint returns; refresh_token is None unless the provider rotated it
+TokenGrant = namedtuple("TokenGrant", ["access_token", "expires_at", "refresh_token"])
+
+class RefreshFailed(Exception):
+    # The refresh token was rejected (revoked, expired); the user has to reconnect the provider
+    pass
+
+class TokenRejected(Exception):
+    # Raised by provider clients when an access token we believed valid gets a 401
+    pass
+
+class TokenEndpoint(ABC):
+    name = None
+
+    @abstractmethod
+    async def refresh(self, refresh_token: str) -> TokenGrant:
+        # Raises RefreshFailed when the provider rejects the refresh token
+        ...
+
+_endpoints = {}
+
+def register_token_endpoint(endpoint: TokenEndpoint):
+    _endpoints[endpoint.name] = endpoint
+    return endpoint
+
+def get_token_endpoint(name: str):
+    return _endpoints.get(name)
+
+class FakeTokenEndpoint(TokenEndpoint):
+    # Local stand-in for a provider's token endpoint, counting calls so tests can see coalescing
+    name = "fake"
+
+    def __init__(self, lifetime: float = 3600, latency: float = 0.0):
+        self.lifetime = lifetime
+        self.latency = latency
+        self.calls = 0
+        self.revoked = set()
+
+    async def refresh(self, refresh_token):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if refresh_token in self.revoked:
+            raise RefreshFailed("invalid_grant")
+        return TokenGrant(f"fake-access-{self.calls}", datetime.utcnow() + timedelta(seconds=self.lifetime), None)
+
+register_token_endpoint(FakeTokenEndpoint())
+
+class TokenManager:
+    def __init__(self, refresh_ahead: float = TOKEN_REFRESH_AHEAD_SECONDS, concurrency: int = TOKEN_REFRESH_CONCURRENCY):
+        self.refresh_ahead = timedelta(seconds=refresh_ahead)
+        self.concurrency = concurrency
+        self.refreshes = 0
+        self._tokens = {}  # user_id -> CachedToken
+        self._expiries = []  # min-heap of (expires_at, user_id); entries are stale once the cached token changes
+        self._inflight = {}  # user_id -> Future of the refresh in progress
+        self._wakeup = asyncio.Event()
+
+    def _store(self, user_id: int, token: CachedToken):
+        self._tokens[user_id] = token
+        heapq.heappush(self._expiries, (token.expires_at, user_id))
+        self._wakeup.set()
+
+    def seed(self, user_id: int, provider: str, access_token: str, expires_at: datetime):
+        # Adopt a token read from the database unless a fresher one is already cached.
+        # A token stored without an expiry is treated as long-lived.
+        expires_at = expires_at or datetime.max
+        cached = self._tokens.get(user_id)
+        if access_token and (cached is None or cached.expires_at < expires_at):
+            self._store(user_id, CachedToken(access_token, expires_at, provider))
+
+    def invalidate(self, user_id: int):
+        # e.g. the provider answered 401 for a token we believed valid
+        self._tokens.pop(user_id, None)
+
+    async def load(self, db):
+        # Prime the cache and the expiry heap with every connected user in one query
+        rows = await db.execute(select(User.id, User.provider, User.access_token, User.token_expiry).where(
+            User.provider != None, User.refresh_token != None
+        ))
+        for user_id, provider, access_token, expires_at in rows:
+            self.seed(user_id, provider, access_token, expires_at)
+
+    async def get_token(self, user_id: int) -> str:
+        cached = self._tokens.get(user_id)
+        if cached is not None and cached.expires_at - datetime.utcnow() > timedelta(seconds=30):
+            return cached.access_token
+        return (await self.refresh(user_id)).access_token
+
+    async def refresh(self, user_id: int) -> CachedToken:
+        # Singleflight: concurrent callers for one user share a single call to the token endpoint
+        future = self._inflight.get(user_id)
+        if future is None:
+            future = self._inflight[user_id] = asyncio.ensure_future(self._refresh(user_id))
+            future.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(future)
+
+    async def _refresh(self, user_id: int) -> CachedToken:
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(select(User.provider, User.refresh_token).where(User.id == user_id))).first()
+            if row is None or row.refresh_token is None:
+                self._tokens.pop(user_id, None)
+                raise RefreshFailed(f"user {user_id} has no refresh token")
+            endpoint = get_token_endpoint(row.provider)
+            if endpoint is None:
+                raise RefreshFailed(f"no token endpoint for provider {row.provider!r}")
+            try:
+                grant = await endpoint.refresh(row.refresh_token)
+            except RefreshFailed:
+                # The grant is dead: clearing it marks the user as needing to reconnect the provider,
+                # and keeps the sync and this manager from retrying it
+                self._tokens.pop(user_id, None)
+                await db.execute(update(User).where(User.id == user_id).values(
+                    refresh_token=None, access_token=None, token_expiry=None
+                ))
+                await db.commit()
+                raise
+            values = {"access_token": grant.access_token, "token_expiry": grant.expires_at}
+            if grant.refresh_token:
+                values["refresh_token"] = grant.refresh_token
+            await db.execute(update(User).where(User.id == user_id).values(**values))
+            await db.commit()
+        self.refreshes += 1
+        token = CachedToken(grant.access_token, grant.expires_at, row.provider)
+        self._store(user_id, token)
+        return token
+
+    def _pop_due(self, now: datetime):
+        due = []
+        while self._expiries and self._expiries[0][0] - self.refresh_ahead <= now:
+            expires_at, user_id = heapq.heappop(self._expiries)
+            cached = self._tokens.get(user_id)
+            if cached is not None and cached.expires_at == expires_at:
+                due.append(user_id)
+        return due
+
+    async def _refresh_quietly(self, user_id: int, slots: asyncio.Semaphore):
+        async with slots:
+            try:
+                await self.refresh(user_id)
+            except Exception as e:
+                logger.warning("Token refresh failed for user %s: %r", user_id, e)
+
+    async def run(self):
+        # Background task: refresh every token refresh_ahead before it expires, so callers rarely wait
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            due = self._pop_due(datetime.utcnow())
+            if due:
+                await asyncio.gather(*(self._refresh_quietly(user_id, slots) for user_id in due))
+                continue
+            delay = TOKEN_REFRESH_MAX_SLEEP
+            if self._expiries:
+                delay = min(delay, max((self._expiries[0][0] - self.refresh_ahead - datetime.utcnow()).total_seconds(), 0))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+token_manager = TokenManager()
@@ -1,29 +1,43 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status, BackgroundTasks
+from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.models.user import User
-from sqlalchemy.orm import scoped_session
+from app.cache import TTLCache
+from app.database import DATABASE_URL, create_db_engine
+from app.outbox import enqueue_email
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import asyncio
 import os
-import smtplib
-from email.mime.text import MIMEText
-import datetime
-import pytz
-from datetime import datetime, timedelta, time as dt_time
+import threading
+import time
+from datetime import datetime, timedelta
 
-DATABASE_URL = "sqlite:///./app.db"
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Every token carries a "type" claim; only "access" tokens authenticate API requests
+ACCESS_TOKEN_TYPE = "access"
 
 RESET_TOKEN_EXPIRE_MINUTES = 15
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+# Feed URLs end up in calendar apps and their logs, so they are signed with a key of their own
+FEED_SECRET_KEY = os.getenv("FEED_SECRET_KEY", "your-feed-secret-key")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+engine = create_db_engine(DATABASE_URL)
+# A new session per call: FastAPI may run a dependency's setup, the endpoint and the teardown on different
+# threadpool threads, so a thread-scoped session would be shared between concurrent requests
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# bcrypt cost factor (log2 rounds): higher is slower to brute force and slower to log in
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Hashing runs on a dedicated pool; once workers + queue are busy, new requests get a 503
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", 16))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
 
 def get_db():
@@ -33,39 +47,104 @@ def get_db():
     finally:
         db.close()
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_capacity = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT)
+_hash_stats_lock = threading.Lock()
+password_hash_stats = {
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "in_flight": 0,
+    "queue_wait_seconds_total": 0.0,
+    "queue_wait_seconds_max": 0.0,
+}
+
+def _password_job_done(future):
+    # Runs when the job itself ends, even if the request awaiting it was cancelled meanwhile
+    _hash_capacity.release()
+    with _hash_stats_lock:
+        password_hash_stats["in_flight"] -= 1
+        password_hash_stats["failed" if future.cancelled() or future.exception() else "completed"] += 1
+
+async def _run_password_job(func, *args):
+    # bcrypt releases the GIL, so a small thread pool bounds CPU use without a process pool.
+    # The caller awaits the job, so no event loop or threadpool thread is held while it runs.
+    if not _hash_capacity.acquire(blocking=False):
+        with _hash_stats_lock:
+            password_hash_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    submitted_at = time.perf_counter()
+
+    def job():
+        waited = time.perf_counter() - submitted_at
+        with _hash_stats_lock:
+            password_hash_stats["queue_wait_seconds_total"] += waited
+            password_hash_stats["queue_wait_seconds_max"] = max(password_hash_stats["queue_wait_seconds_max"], waited)
+        return func(*args)
+
+    with _hash_stats_lock:
+        password_hash_stats["in_flight"] += 1
+    future = _hash_executor.submit(job)
+    future.add_done_callback(_password_job_done)
+    return await asyncio.wrap_future(future)
+
+async def get_password_hash(password: str) -> str:
+    return await _run_password_job(pwd_context.hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(pwd_context.verify, plain_password, hashed_password)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     import datetime
     expire = datetime.datetime.utcnow() + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "type": ACCESS_TOKEN_TYPE})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+def credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_access_token(token: str) -> int:
+    # The user id of a valid access token; anything else is a 401
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        if payload.get("type") != ACCESS_TOKEN_TYPE:
+            raise JWTError()
+        return int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise credentials_exception()
+
+def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    user_id = decode_access_token(token)
     user = db.query(User).filter(User.id == user_id).first()
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
 
-def require_superadmin(current_user: User = Depends(get_current_user)):
+# Lightweight authenticated identity for routes that only need id/role, cached to skip the users query
+Principal = namedtuple("Principal", ["id", "role", "email", "timezone"])
+principal_cache = TTLCache(int(os.getenv("PRINCIPAL_CACHE_SIZE", 4096)), float(os.getenv("PRINCIPAL_CACHE_TTL", 30)))
+
+def get_current_principal(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    user_id = decode_access_token(token)
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        row = db.query(User.id, User.role, User.email, User.timezone).filter(User.id == user_id).first()
+        if row is None:
+            raise credentials_exception()
+        principal = Principal(*row)
+        principal_cache.set(user_id, principal)
+    return principal
+
+def invalidate_principal(user_id: int):
+    principal_cache.pop(int(user_id))
+
+def require_superadmin(current_user: Principal = Depends(get_current_principal)):
     if current_user.role != "superadmin":
         raise HTTPException(status_code=403, detail="Superadmin privileges required")
     return current_user
@@ -73,8 +152,9 @@ def require_superadmin(current_user: User = Depends(get_current_user)):
 # Password reset token
 
 def create_password_reset_token(user_id: int):
-    expire = datetime.datetime.utcnow() + datetime.timedelta(minutes=RESET_TOKEN_EXPIRE_MINUTES)
-    to_encode = {"sub": user_id, "exp": expire.timestamp(), "type": "reset"}
+    expire = datetime.utcnow() + timedelta(minutes=RESET_TOKEN_EXPIRE_MINUTES)
+    # python-jose only accepts a string "sub"
+    to_encode = {"sub": str(user_id), "exp": expire.timestamp(), "type": "reset"}
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def verify_password_reset_token(token: str):
@@ -82,73 +162,26 @@ def verify_password_reset_token(token: str):
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         if payload.get("type") != "reset":
             raise JWTError()
-        return payload.get("sub")
-    except JWTError:
+        return int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+
+# Calendar feed token: calendar apps cannot send a bearer header, so the feed URL carries this instead.
+# It never expires; "ver" is User.feed_token_version when it was issued, and bumping that revokes it.
+
+def create_feed_token(user_id: int, version: int):
+    return jwt.encode({"sub": str(user_id), "type": "feed", "ver": version}, FEED_SECRET_KEY, algorithm=ALGORITHM)
+
+def verify_feed_token(token: str):
+    # (user_id, version), or None; the caller still has to compare the version with the user's current one
+    try:
+        payload = jwt.decode(token, FEED_SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("type") != "feed":
+            raise JWTError()
+        return int(payload["sub"]), int(payload["ver"])
+    except (JWTError, KeyError, TypeError, ValueError):
         return None
 
-def send_reset_email(background_tasks: BackgroundTasks, to_email: str, reset_link: str):
-    def send():
-        # Dummy SMTP setup
-        msg = MIMEText(f"Click the link to reset your password: {reset_link}")
-        msg["Subject"] = "Password Reset"
-        msg["From"] = "noreply@example.com"
-        msg["To"] = to_email
-        try:
-            with smtplib.SMTP("localhost", 1025) as server:
-                server.sendmail(msg["From"], [to_email], msg.as_string())
-        except Exception as e:
-            print(f"Email send failed: {e}")
-    background_tasks.add_task(send)
-
-def get_todays_meetings(user, date):
-    # Stub: Replace with real meeting query
-    return [
-        {"title": "Meeting 1", "time": "10:00"},
-        {"title": "Meeting 2", "time": "15:00"}
-    ]
-
-def send_agenda_email(background_tasks: BackgroundTasks, to_email: str, agenda: str):
-    def send():
-        msg = MIMEText(agenda)
-        msg["Subject"] = "Your Daily Agenda"
-        msg["From"] = "noreply@example.com"
-        msg["To"] = to_email
-        try:
-            with smtplib.SMTP("localhost", 1025) as server:
-                server.sendmail(msg["From"], [to_email], msg.as_string())
-        except Exception as e:
-            print(f"Agenda email send failed: {e}")
-    background_tasks.add_task(send)
-
-def agenda_scheduler(db: Session, background_tasks: BackgroundTasks):
-    now_utc = datetime.utcnow()
-    users = db.query(User).filter(User.send_daily_agenda == True, User.agenda_send_time != None, User.timezone != None).all()
-    for user in users:
-        try:
-            user_tz = pytz.timezone(user.timezone)
-            user_now = now_utc.astimezone(user_tz)
-            agenda_time = datetime.strptime(user.agenda_send_time, "%H:%M").time()
-            if user_now.time().replace(second=0, microsecond=0) == agenda_time:
-                today = user_now.date()
-                meetings = get_todays_meetings(user, today)
-                agenda = "Your meetings for today:\n" + "\n".join([f"{m['time']} - {m['title']}" for m in meetings])
-                send_agenda_email(background_tasks, user.email, agenda)
-        except Exception as e:
-            print(f"Agenda scheduler error for user {user.id}: {e}")
-
-def sync_secondary_to_primary(db: Session, user: User):
-    # Stub: Find all secondary calendars for user
-    secondary_cals = db.query(user.calendars.property.mapper.class_).filter_by(user_id=user.id, is_primary=False).all()
-    primary_cal = db.query(user.calendars.property.mapper.class_).filter_by(user_id=user.id, is_primary=True).first()
-    if not primary_cal:
-        print(f"No primary calendar for user {user.id}")
-        return
-    for cal in secondary_cals:
-        # Stub: Get events from secondary calendar
-        events = []  # Replace with real fetch
-        for event in events:
-            # Block as '[Busy]' or clone real title
-            title = '[Busy]' if not cal.subject_prefix else f"{cal.subject_prefix} {event['title']}"
-            # Insert into primary calendar (stub)
-            print(f"Syncing event to primary: {title}")
-    print(f"Synced secondary to primary for user {user.id}") 
\ No newline at end of file
+def send_reset_email(db, to_email: str, reset_link: str, idempotency_key: str = None):
+    # Queued in the outbox within the caller's transaction; app.email_worker delivers it
+    enqueue_email(db, to_email, "Password Reset", f"Click the link to reset your password: {reset_link}", idempotency_key)
@@ -0,0 +1,84 @@
+"""Throughput of the public slots route on the async session vs the same handler on the sync session.
+
+    python benchmarks/async_vs_sync.py [concurrency] [requests]
+
+Runs in-process against a scratch SQLite database. The slot cache is disabled so every request computes.
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("RATE_LIMIT", "1000000")
+os.environ.setdefault("RATE_LIMIT_RULES", "")
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+import httpx
+from datetime import datetime, timedelta
+from fastapi import Depends, HTTPException
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+import main
+from app.cache import slot_cache, get_active_agenda
+from app.models import User, Calendar, Agenda, Meeting
+from app.models.user import Base
+from app.slots import compute_available_slots
+from app.async_db import async_engine
+from app.utils import engine, get_db, SessionLocal
+
+CONCURRENCY = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+@main.app.get("/bench/sync/{alias_name}/slots")
+def sync_slots(alias_name: str, db: Session = Depends(get_db)):
+    # The pre-async version of the route: a threadpool worker is held for the whole request
+    agenda = get_active_agenda(db, alias_name)
+    if not agenda:
+        raise HTTPException(status_code=404, detail="Agenda not found")
+    return compute_available_slots(db, agenda)
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.execute(insert(User), [{"name": "o", "email": "o@example.com", "password": "x", "alias": "o", "role": "user", "send_daily_agenda": False}])
+    db.execute(insert(Calendar), [{"user_id": 1, "alias": "c", "is_primary": True, "sync_direction": "one-way"}])
+    db.execute(insert(Agenda), [{"user_id": 1, "calendar_id": 1, "slot_duration": 30, "alias_name": "bench", "is_active": True}])
+    start = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0)
+    db.execute(insert(Meeting), [
+        {"agenda_id": 1, "start_time": start + timedelta(days=day, hours=2 * i), "end_time": start + timedelta(days=day, hours=2 * i, minutes=30),
+         "booked_by_email": "v@example.com", "meeting_type": "virtual", "status": "booked"}
+        for day in range(7) for i in range(4)
+    ])
+    db.commit()
+    db.close()
+
+async def run(path: str):
+    latencies = []
+    gate = asyncio.Semaphore(CONCURRENCY)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        async def one():
+            async with gate:
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.text
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(REQUESTS)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return REQUESTS / elapsed, latencies[int(len(latencies) * 0.99)] * 1000
+
+async def bench():
+    for mode, path in (("sync", "/bench/sync/bench/slots"), ("async", "/agendas/public/bench/slots")):
+        await run(path)  # warm-up
+        rate, p99 = await run(path)
+        print(f"{mode:6} concurrency {CONCURRENCY}: {rate:7.0f} req/s  p99 {p99:7.1f} ms")
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    seed()
+    slot_cache.maxsize = 0  # every request computes its slots
+    asyncio.run(bench())
@@ -0,0 +1,93 @@
+"""Full and incremental calendar sync against the fake provider.
+
+    python benchmarks/calendar_sync.py [calendars] [events per calendar] [provider latency ms]
+
+Seeds users with one secondary calendar each (in a scratch SQLite database) and a FakeCalendarProvider with
+`events` events per calendar and a simulated round trip per page. It then times a full sync, an incremental
+sync after 1% of the events changed, and a no-op sync, for a few SYNC_CONCURRENCY values.
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, update
+from app.async_db import async_engine
+from app.calendar_sync import FakeCalendarProvider, register_provider, sync_calendars
+from app.models import User, Calendar, CalendarEvent
+from app.models.user import Base
+from app.utils import engine, SessionLocal
+
+CALENDARS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+EVENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+LATENCY = (float(sys.argv[3]) if len(sys.argv) > 3 else 50) / 1000
+CONCURRENCY = (1, 16, 64)
+START = datetime(2030, 1, 7, 9, 0)
+
+provider = register_provider(FakeCalendarProvider(latency=LATENCY))
+
+def seed():
+    # User i owns primary calendar 2i-1 and secondary calendar 2i, mirrored from provider calendar "cal-i"
+    Base.metadata.create_all(bind=engine)
+    expiry = datetime.utcnow() + timedelta(days=1)
+    db = SessionLocal()
+    db.execute(insert(User), [
+        {"id": i, "name": f"u{i}", "email": f"u{i}@example.com", "password": "x", "alias": f"u{i}", "role": "user",
+         "send_daily_agenda": False, "provider": "fake", "refresh_token": "r", "access_token": "a", "token_expiry": expiry}
+        for i in range(1, CALENDARS + 1)
+    ])
+    db.execute(insert(Calendar), [
+        {"id": 2 * i - 1 + secondary, "user_id": i, "alias": f"c{i}-{secondary}", "is_primary": not secondary,
+         "sync_direction": "one-way", "external_id": f"cal-{i}" if secondary else None, "subject_prefix": "[Work]"}
+        for i in range(1, CALENDARS + 1) for secondary in (0, 1)
+    ])
+    db.commit()
+    db.close()
+    for i in range(1, CALENDARS + 1):
+        for e in range(EVENTS):
+            start = START + timedelta(minutes=30 * e)
+            provider.put_event(f"cal-{i}", f"e{e}", f"Event {e}", start, start + timedelta(minutes=30))
+
+def change_some():
+    # 1% of each calendar's events move, one more in 200 is cancelled
+    for i in range(1, CALENDARS + 1):
+        for e in range(0, EVENTS, 100):
+            start = START + timedelta(days=1, minutes=30 * e)
+            provider.put_event(f"cal-{i}", f"e{e}", f"Moved {e}", start, start + timedelta(minutes=30))
+        for e in range(50, EVENTS, 200):
+            provider.cancel_event(f"cal-{i}", f"e{e}")
+
+def reset():
+    db = SessionLocal()
+    db.execute(delete(CalendarEvent))
+    db.execute(update(Calendar).values(sync_token=None, sync_cursor=None))
+    db.commit()
+    db.close()
+
+async def timed(concurrency: int):
+    requests = provider.requests
+    started = time.perf_counter()
+    applied = await sync_calendars(concurrency=concurrency)
+    return time.perf_counter() - started, sum(applied.values()), provider.requests - requests
+
+async def bench():
+    for concurrency in CONCURRENCY:
+        reset()
+        results = [await timed(concurrency)]
+        change_some()
+        results.append(await timed(concurrency))
+        results.append(await timed(concurrency))
+        print(f"concurrency {concurrency:3}: " + "  ".join(
+            f"{label} {seconds:6.2f} s ({changes} changes, {requests} requests)"
+            for label, (seconds, changes, requests) in zip(("full", "incremental", "no-op"), results)
+        ))
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    seed()
+    asyncio.run(bench())
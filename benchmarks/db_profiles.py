@@ -0,0 +1,96 @@
+"""Mixed read/write load on SQLite under each DB_PROFILE.
+
+    python benchmarks/db_profiles.py [seconds] [readers] [writers]
+
+For each profile, a fresh database file with 20k meetings across 50 agendas is hammered by reader threads
+(the slots overlap query) and writer threads (one booking per transaction). Reports throughput, p99 latency
+and errors such as "database is locked" per profile.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+from app.database import SQLITE_PROFILES, create_db_engine
+from app.models import User, Calendar, Agenda, Meeting
+from app.models.user import Base
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+READERS = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+WRITERS = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+AGENDAS = 50
+MEETINGS = 20000
+BASE = datetime(2030, 1, 1)
+
+def seed(engine):
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.execute(insert(User), [{"name": "o", "email": "o@example.com", "password": "x", "alias": "o", "role": "user", "send_daily_agenda": False}])
+        db.execute(insert(Calendar), [{"user_id": 1, "alias": "c", "is_primary": True, "sync_direction": "one-way"}])
+        db.execute(insert(Agenda), [
+            {"user_id": 1, "calendar_id": 1, "slot_duration": 30, "alias_name": f"a{i}", "is_active": True} for i in range(AGENDAS)
+        ])
+        db.execute(insert(Meeting), [
+            {"agenda_id": 1 + i % AGENDAS, "start_time": BASE + timedelta(minutes=30 * i), "end_time": BASE + timedelta(minutes=30 * i + 30),
+             "booked_by_email": "v@example.com", "meeting_type": "virtual", "status": "booked"}
+            for i in range(MEETINGS)
+        ])
+        db.commit()
+
+def read(db):
+    start = BASE + timedelta(days=random.randint(0, 300))
+    db.execute(select(Meeting.start_time, Meeting.end_time).where(
+        Meeting.agenda_id == random.randint(1, AGENDAS), Meeting.start_time < start + timedelta(days=7), Meeting.end_time > start,
+    )).all()
+
+def write(db):
+    start = BASE + timedelta(days=random.randint(0, 3000), minutes=random.randint(0, 1440))
+    db.add(Meeting(agenda_id=random.randint(1, AGENDAS), start_time=start, end_time=start + timedelta(minutes=30),
+                   booked_by_email="w@example.com", meeting_type="virtual", status="booked"))
+    db.commit()
+
+def run(profile: str):
+    engine = create_db_engine(f"sqlite:///{tempfile.mkdtemp()}/bench.db", profile)
+    seed(engine)
+    Session = sessionmaker(bind=engine)
+    latencies = {"read": [], "write": []}
+    errors = []
+    stop_at = time.perf_counter() + SECONDS
+
+    def worker(kind, op):
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                with Session() as db:
+                    op(db)
+            except Exception as e:
+                errors.append(e)
+                continue
+            latencies[kind].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=("read", read)) for _ in range(READERS)]
+    threads += [threading.Thread(target=worker, args=("write", write)) for _ in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    line = [f"{profile:8}"]
+    for kind, samples in latencies.items():
+        samples.sort()
+        p99 = samples[int(len(samples) * 0.99)] * 1000 if samples else float("nan")
+        line.append(f"{kind}s {len(samples) / SECONDS:7.0f}/s p99 {p99:7.1f} ms")
+    line.append(f"errors {len(errors)}")
+    print("  ".join(line))
+
+if __name__ == "__main__":
+    for profile in SQLITE_PROFILES:
+        run(profile)
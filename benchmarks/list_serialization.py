@@ -0,0 +1,70 @@
+"""List endpoint serialisation: ORM objects + response_model + JSONResponse vs column tuples + orjson.
+
+    python benchmarks/list_serialization.py [repeat]
+
+Times what GET /agendas/ does for 1k and 10k agendas, query included, the way it did before app.responses
+(ORM objects, validated through AgendaResponse, jsonable_encoder, JSONResponse) and with rows_response.
+Both produce the same JSON; the best of `repeat` runs is reported.
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import time
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import insert
+from app.models import User, Calendar, Agenda
+from app.models.user import Base
+from app.responses import rows_response
+from app.routes.agenda import AGENDA_COLUMNS
+from app.schemas.agenda import AgendaResponse
+from app.utils import engine, SessionLocal
+
+REPEAT = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+SIZES = (1000, 10000)
+
+def seed():
+    # User n owns exactly n agendas for each n in SIZES
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.execute(insert(User), [
+        {"id": size, "name": "o", "email": f"o{size}@example.com", "password": "x", "alias": f"o{size}", "role": "user", "send_daily_agenda": False}
+        for size in SIZES
+    ])
+    db.execute(insert(Calendar), [{"user_id": size, "alias": "c", "is_primary": True, "sync_direction": "one-way"} for size in SIZES])
+    db.execute(insert(Agenda), [
+        {"user_id": size, "calendar_id": calendar_id, "slot_duration": 30, "alias_name": f"a{size}-{i}", "is_active": True}
+        for calendar_id, size in enumerate(SIZES, start=1) for i in range(size)
+    ])
+    db.commit()
+    db.close()
+
+def orm_response(db, user_id):
+    agendas = db.query(Agenda).filter(Agenda.user_id == user_id).all()
+    return JSONResponse(jsonable_encoder([AgendaResponse.from_orm(agenda) for agenda in agendas])).body
+
+def tuple_response(db, user_id):
+    return rows_response(db.query(*AGENDA_COLUMNS).filter(Agenda.user_id == user_id).all(), AgendaResponse).body
+
+def best(func, user_id):
+    timings = []
+    for _ in range(REPEAT):
+        db = SessionLocal()
+        started = time.perf_counter()
+        body = func(db, user_id)
+        timings.append(time.perf_counter() - started)
+        db.close()
+    return min(timings) * 1000, body
+
+if __name__ == "__main__":
+    seed()
+    for size in SIZES:
+        orm_ms, orm_body = best(orm_response, size)
+        tuple_ms, tuple_body = best(tuple_response, size)
+        assert json.loads(orm_body) == json.loads(tuple_body)
+        print(f"{size:6} agendas: ORM + response_model {orm_ms:8.1f} ms   tuples + orjson {tuple_ms:7.1f} ms   {orm_ms / tuple_ms:4.1f}x")
@@ -0,0 +1,93 @@
+"""Latency of GET /teams/{id}/free-slots by team size and horizon.
+
+    python benchmarks/team_free_slots.py [runs] [meetings per member per day]
+
+Teams of 10, 100 and 1000 registered members, spread over three European timezones with 09:00-17:00
+weekday availability and a few random meetings per member per day, so common free time gets sparse as the
+team grows; with the defaults the larger teams have none, the worst case, where the whole horizon is scanned.
+Each team is searched `runs` times over 7, 30 and 60 days, in-process against a scratch SQLite database.
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("RATE_LIMIT", "1000000")
+os.environ.setdefault("RATE_LIMIT_RULES", "")
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+import main
+from app.models import User, Calendar, Agenda, Meeting, Team, TeamMember, AvailabilitySlot
+from app.models.user import Base
+from app.utils import engine, SessionLocal, create_access_token
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+MEETINGS_PER_DAY = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+SIZES = (10, 100, 1000)
+HORIZONS = (7, 30, 60)
+TIMEZONES = ("Europe/London", "Europe/Paris", "Europe/Berlin")
+
+def seed():
+    # User 1 owns every team; members are users m{id} with consecutive ids and an agenda and calendar of their own
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    db = SessionLocal()
+    db.execute(insert(User), [{"id": 1, "name": "o", "email": "o@example.com", "password": "x", "alias": "o", "role": "user", "send_daily_agenda": False}])
+    user_id = 1
+    for team_id, size in enumerate(SIZES, start=1):
+        db.execute(insert(Team), [{"id": team_id, "user_id": 1, "name": f"team{size}"}])
+        members = list(range(user_id + 1, user_id + 1 + size))
+        user_id += size
+        db.execute(insert(User), [
+            {"id": member, "name": f"m{member}", "email": f"m{member}@example.com", "password": "x", "alias": f"m{member}",
+             "role": "user", "send_daily_agenda": False, "timezone": TIMEZONES[member % len(TIMEZONES)]}
+            for member in members
+        ])
+        db.execute(insert(TeamMember), [{"team_id": team_id, "email": f"m{member}@example.com"} for member in members])
+        db.execute(insert(AvailabilitySlot), [
+            {"user_id": member, "day_of_week": day, "start_time": "09:00", "end_time": "17:00"} for member in members for day in range(5)
+        ])
+        # Calendar and agenda ids equal the member's user id
+        db.execute(insert(Calendar), [{"id": member, "user_id": member, "alias": "c", "is_primary": True, "sync_direction": "one-way"} for member in members])
+        db.execute(insert(Agenda), [
+            {"id": member, "user_id": member, "calendar_id": member, "slot_duration": 30, "alias_name": f"m{member}", "is_active": True}
+            for member in members
+        ])
+        meetings = []
+        for member in members:
+            for day in range(max(HORIZONS) + 1):
+                for _ in range(MEETINGS_PER_DAY):
+                    start = today + timedelta(days=day, hours=rng.randrange(7, 17), minutes=rng.choice((0, 30)))
+                    meetings.append({"agenda_id": member, "start_time": start, "end_time": start + timedelta(minutes=30),
+                                     "booked_by_email": "visitor@example.com", "meeting_type": "virtual", "status": "booked"})
+        db.execute(insert(Meeting), meetings)
+    db.commit()
+    db.close()
+
+def bench():
+    client = TestClient(main.app)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': '1'})}"}
+    for team_id, size in enumerate(SIZES, start=1):
+        for days in HORIZONS:
+            timings = []
+            for run in range(RUNS + 1):
+                started = time.perf_counter()
+                response = client.get(f"/teams/{team_id}/free-slots", params={"days": days, "limit": 100}, headers=headers)
+                elapsed = time.perf_counter() - started
+                assert response.status_code == 200, response.text
+                if run:  # the first request warms the caches
+                    timings.append(elapsed * 1000)
+            print(f"{size:5} members, {days:2} days: median {statistics.median(timings):8.1f} ms  "
+                  f"max {max(timings):8.1f} ms  {len(response.json()):3} slots")
+
+if __name__ == "__main__":
+    seed()
+    bench()
@@ -0,0 +1,84 @@
+"""Latency and SQL statement count of POST /teams/meetings by team size.
+
+    python benchmarks/team_meetings.py [runs]
+
+Teams of 10, 100 and 1000 members (half of them registered users, so the busy check has work to do) each
+book `runs` meetings at distinct times, in-process against a scratch SQLite database.
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("RATE_LIMIT", "1000000")
+os.environ.setdefault("RATE_LIMIT_RULES", "")
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import statistics
+import time
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+import main
+from app.async_db import async_engine
+from app.models import User, Calendar, Agenda, Team, TeamMember
+from app.models.user import Base
+from app.utils import engine, SessionLocal, create_access_token
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+SIZES = (10, 100, 1000)
+
+statements = 0
+
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+# The route runs on the async engine; authentication still reads through the sync one
+for counted in (engine, async_engine.sync_engine):
+    event.listen(counted, "before_cursor_execute", _count)
+
+def seed():
+    # User 1 owns the agenda and every team; team members m{size}-{i} are registered users for even i
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.execute(insert(User), [{"name": "o", "email": "o@example.com", "password": "x", "alias": "o", "role": "user", "send_daily_agenda": False}])
+    db.execute(insert(Calendar), [{"user_id": 1, "alias": "c", "is_primary": True, "sync_direction": "one-way"}])
+    db.execute(insert(Agenda), [{"user_id": 1, "calendar_id": 1, "slot_duration": 30, "alias_name": "bench", "is_active": True}])
+    for team_id, size in enumerate(SIZES, start=1):
+        db.execute(insert(Team), [{"id": team_id, "user_id": 1, "name": f"team{size}"}])
+        emails = [f"m{size}-{i}@example.com" for i in range(size)]
+        db.execute(insert(TeamMember), [{"team_id": team_id, "email": email} for email in emails])
+        db.execute(insert(User), [
+            {"name": email, "email": email, "password": "x", "alias": email.split("@")[0], "role": "user", "send_daily_agenda": False}
+            for email in emails[::2]
+        ])
+    db.commit()
+    db.close()
+
+def bench():
+    global statements
+    client = TestClient(main.app)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': '1'})}"}
+    start = datetime(2030, 1, 7, 9, 0)
+    for team_id, size in enumerate(SIZES, start=1):
+        timings = []
+        counts = []
+        for run in range(RUNS + 1):
+            slot = start + timedelta(days=team_id * 100 + run)
+            body = {"agenda_id": 1, "start_time": slot.isoformat(), "end_time": (slot + timedelta(minutes=30)).isoformat(),
+                    "booked_by_email": "o@example.com", "meeting_type": "virtual"}
+            statements = 0
+            started = time.perf_counter()
+            response = client.post("/teams/meetings", params={"team_id": team_id}, json=body, headers=headers)
+            elapsed = time.perf_counter() - started
+            assert response.status_code == 200 and len(response.json()) == size, response.text
+            if run:  # the first request warms the caches
+                timings.append(elapsed * 1000)
+                counts.append(statements)
+        print(f"{size:5} members: median {statistics.median(timings):8.1f} ms  max {max(timings):8.1f} ms  {max(counts)} SQL statements")
+
+if __name__ == "__main__":
+    seed()
+    bench()
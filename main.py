@@ -1,42 +1,80 @@
-from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
-from app.routes import user, availability, calendar, agenda, team
-from app.middleware import LoggingMiddleware
-from starlette.middleware import Middleware
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from app.routes import user, availability, calendar, agenda, team, feed
+from app.middleware import LoggingMiddleware, MetricsMiddleware, RateLimitMiddleware
+from app.metrics import Gauge, instrument_engine, pool_stats, render as render_metrics
+from app.utils import engine, SessionLocal, password_hash_stats
+from app.outbox import outbox_depth
+from app.async_db import async_engine
+from app.cache import cache_stats
+from app.slot_events import slot_events
+from app.replicas import replica_engines, async_replica_engines
+from app.ratelimit import RateLimiter, RateRule, create_backend, parse_rules
 from dotenv import load_dotenv
 import os
-import time
-from collections import defaultdict
 
 load_dotenv()
 
-app = FastAPI()
+# orjson serialises responses several times faster than the stdlib encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 
-# Add logging middleware
-app.add_middleware(LoggingMiddleware)
-
-# Simple in-memory rate limiter (per IP)
+# Token-bucket rate limiter (per IP); use RATE_LIMIT_BACKEND=sqlite to share limits across workers
 RATE_LIMIT = int(os.getenv("RATE_LIMIT", 5))
 RATE_PERIOD = 1  # seconds
-rate_limiters = defaultdict(list)
-
-@app.middleware("http")
-async def rate_limiter(request: Request, call_next):
-    ip = request.client.host
-    now = time.time()
-    window = rate_limiters[ip]
-    # Remove old requests
-    window = [t for t in window if now - t < RATE_PERIOD]
-    if len(window) >= RATE_LIMIT:
-        return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"})
-    window.append(now)
-    rate_limiters[ip] = window
-    return await call_next(request)
+RATE_LIMIT_RULES = os.getenv("RATE_LIMIT_RULES", "POST /users/login 5/60; POST /agendas/public/*/book 10/60")
+limiter = RateLimiter(
+    create_backend(
+        os.getenv("RATE_LIMIT_BACKEND", "memory"),
+        os.getenv("RATE_LIMIT_DB", "./ratelimit.db"),
+        float(os.getenv("RATE_LIMIT_DB_TIMEOUT", 0.1)),
+    ),
+    RateRule("default", None, None, RATE_LIMIT, RATE_PERIOD),
+    parse_rules(RATE_LIMIT_RULES),
+)
+
+# The last middleware added is the outermost: logging wraps metrics, which wraps the rate limiter
+app.add_middleware(RateLimitMiddleware, limiter=limiter)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(LoggingMiddleware)
+
+# Prometheus metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+engines = {"sync": engine, "async": async_engine.sync_engine}
+for index, (replica, async_replica) in enumerate(zip(replica_engines, async_replica_engines)):
+    for name, db_engine in ((f"replica{index}", replica), (f"replica{index}_async", async_replica.sync_engine)):
+        instrument_engine(db_engine, name)
+        engines[name] = db_engine
+Gauge("db_pool_connections", "Connection pool state per engine.", ("engine", "stat"),
+      callback=lambda: pool_stats(engines))
+Gauge("password_hash_pool", "Password hashing pool counters (see app.utils.password_hash_stats).", ("stat",),
+      callback=lambda: {(stat,): value for stat, value in password_hash_stats.items()})
+Gauge("cache_stats", "In-process cache counters.", ("cache", "stat"),
+      callback=lambda: {(cache, stat): value for cache, stats in cache_stats().items() for stat, value in stats.items()})
+
+Gauge("slot_event_subscribers", "Clients subscribed to slot events in this process.",
+      callback=lambda: {(): slot_events.subscriber_count()})
+Gauge("slot_events_dropped", "Slot events dropped for clients that fell behind (replaced by a resync).",
+      callback=lambda: {(): slot_events.dropped})
+
+def _outbox_depth():
+    db = SessionLocal()
+    try:
+        return outbox_depth(db)
+    finally:
+        db.close()
+
+Gauge("email_queue_depth", "Emails in the outbox waiting for delivery.", callback=lambda: {(): _outbox_depth()})
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 app.include_router(user.router, prefix="/users", tags=["users"])
 app.include_router(availability.router, prefix="/availability", tags=["availability"])
 app.include_router(calendar.router, prefix="/calendars", tags=["calendars"])
 app.include_router(agenda.router, prefix="/agendas", tags=["agendas"])
 app.include_router(team.router, prefix="/teams", tags=["teams"])
+app.include_router(feed.router, prefix="/feeds", tags=["feeds"])
 
 # FastAPI auto-generates Swagger docs at /docs and OpenAPI at /openapi.json 
\ No newline at end of file
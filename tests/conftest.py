@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+# The engines are created at import time from the environment, so point them at a scratch database
+# before any app module is imported
+_tmp = tempfile.mkdtemp(prefix="smartcal-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/app.db")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("RATE_LIMIT", "100000")
+os.environ.setdefault("RATE_LIMIT_RULES", "")
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+
+import pytest
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    from app.utils import engine
+    from app.models.user import Base
+    import app.models  # noqa: F401  registers every table
+    Base.metadata.create_all(bind=engine)
+    yield
+    engine.dispose()
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import time
+import httpx
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app.models import User, Calendar, Agenda, Meeting
+from app.utils import SessionLocal
+import main
+
+# Hundreds of concurrent bookings racing for the same slots; sizes can be raised for a heavier run
+STRESS_SLOTS = int(os.getenv("BOOKING_STRESS_SLOTS", 50))
+STRESS_PER_SLOT = int(os.getenv("BOOKING_STRESS_PER_SLOT", 6))
+# Generous on purpose: it catches a lock convoy or a hang, not ordinary slowness of a loaded CI machine
+STRESS_MAX_P99_SECONDS = float(os.getenv("BOOKING_STRESS_MAX_P99_SECONDS", 30))
+
+def _create_agenda(alias_name: str) -> int:
+    db = SessionLocal()
+    try:
+        user = User(name="owner", email=f"{alias_name}@example.com", password="x", alias=alias_name)
+        db.add(user)
+        db.flush()
+        calendar = Calendar(user_id=user.id, alias="primary", is_primary=True)
+        db.add(calendar)
+        db.flush()
+        agenda = Agenda(user_id=user.id, calendar_id=calendar.id, slot_duration=30, alias_name=alias_name)
+        db.add(agenda)
+        db.commit()
+        return agenda.id
+    finally:
+        db.close()
+
+def test_concurrent_bookings_have_one_winner_per_slot():
+    agenda_id = _create_agenda("stress")
+    day = (datetime.utcnow() + timedelta(days=2)).replace(hour=8, minute=0, second=0, microsecond=0)
+    latencies = []
+    statuses = []
+
+    async def book(client, slot, visitor):
+        start = day + timedelta(minutes=30 * slot)
+        body = {
+            "agenda_id": agenda_id,
+            "start_time": start.isoformat(),
+            "end_time": (start + timedelta(minutes=30)).isoformat(),
+            "booked_by_email": f"v{slot}-{visitor}@example.com",
+            "meeting_type": "virtual",
+        }
+        started = time.perf_counter()
+        response = await client.post("/agendas/public/stress/book", json=body)
+        latencies.append(time.perf_counter() - started)
+        statuses.append(response.status_code)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            await asyncio.gather(*(book(client, slot, visitor) for slot in range(STRESS_SLOTS) for visitor in range(STRESS_PER_SLOT)))
+
+    asyncio.run(run())
+
+    assert statuses.count(200) == STRESS_SLOTS
+    latencies.sort()
+    assert latencies[int(len(latencies) * 0.99)] < STRESS_MAX_P99_SECONDS
+    assert set(statuses) <= {200, 400}
+
+    db = SessionLocal()
+    try:
+        per_slot = db.query(Meeting.start_time, func.count()).filter(Meeting.agenda_id == agenda_id).group_by(Meeting.start_time).all()
+    finally:
+        db.close()
+    assert len(per_slot) == STRESS_SLOTS
+    assert all(count == 1 for _, count in per_slot)
@@ -0,0 +1,81 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app.models import User, Calendar
+from app.bulk import BULK_MAX_RECORD_BYTES, _lines
+from app.utils import SessionLocal, create_access_token
+import main
+
+client = TestClient(main.app)
+
+def _create_user(alias: str) -> int:
+    db = SessionLocal()
+    try:
+        user = User(name=alias, email=f"{alias}@example.com", password="x", alias=alias)
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def _import(user_id: int, body: bytes, fmt: str):
+    return client.post(
+        "/calendars/import", params={"format": fmt}, content=body,
+        headers={"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"},
+    )
+
+def _aliases(user_id: int):
+    db = SessionLocal()
+    try:
+        return [alias for alias, in db.query(Calendar.alias).filter(Calendar.user_id == user_id).order_by(Calendar.id)]
+    finally:
+        db.close()
+
+def test_csv_import_reports_bad_lines_and_keeps_multiline_fields():
+    user_id = _create_user("bulk")
+    body = (
+        b"\xef\xbb\xbfalias,subject_prefix\r\n"
+        b"work,\"[Work]\r\nsecond line\"\r\n"
+        b"bad-\xff-bytes,x\r\n"
+        b"home,\"say \"\"hi\"\"\"\r\n"
+        b"\"unterminated,x\r\n"
+    )
+    response = _import(user_id, body, "csv")
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 2
+    assert [error["line"] for error in report["errors"]] == [4, 6]
+    assert "utf-8" in report["errors"][0]["error"]
+    db = SessionLocal()
+    try:
+        rows = db.query(Calendar.alias, Calendar.subject_prefix).filter(Calendar.user_id == user_id).order_by(Calendar.id).all()
+        assert rows == [("work", "[Work]\nsecond line"), ("home", 'say "hi"')]
+    finally:
+        db.close()
+
+def test_overlong_line_is_rejected_without_losing_the_next_one():
+    user_id = _create_user("bulk-long")
+    body = b'{"alias": "before"}\n{"alias": "' + b"x" * (2 * BULK_MAX_RECORD_BYTES) + b'"}\n{"alias": "after"}\n'
+    report = _import(user_id, body, "ndjson").json()
+    assert report["imported"] == 2
+    assert report["errors"] == [{"line": 2, "error": f"record longer than {BULK_MAX_RECORD_BYTES} bytes"}]
+    assert _aliases(user_id) == ["before", "after"]
+
+def test_streamed_overlong_line_is_not_buffered():
+    class ChunkedRequest:
+        async def stream(self):
+            body = b"a\n" + b"x" * (10 * BULK_MAX_RECORD_BYTES) + b"\nb"
+            for i in range(0, len(body), 1000):
+                yield body[i:i + 1000]
+
+    async def collect():
+        return [(line_no, len(raw)) async for line_no, raw in _lines(ChunkedRequest())]
+
+    lines = asyncio.run(collect())
+    assert [line_no for line_no, _ in lines] == [1, 2, 3]
+    assert BULK_MAX_RECORD_BYTES < lines[1][1] <= BULK_MAX_RECORD_BYTES + 1000
+
+def test_unreadable_csv_header_fails_the_import():
+    user_id = _create_user("bulk-header")
+    response = _import(user_id, b"ali\xffas,subject_prefix\nalias,subject_prefix\nwork,x\n", "csv")
+    assert response.status_code == 400
+    assert _aliases(user_id) == []
@@ -0,0 +1,125 @@
+import asyncio
+import itertools
+from datetime import datetime, timedelta
+from app.async_db import async_engine
+from app.calendar_sync import FakeCalendarProvider, register_provider, sync_calendars
+from app.models import User, Calendar, CalendarEvent
+from app.utils import SessionLocal
+
+_ids = itertools.count()
+START = datetime(2030, 1, 7, 9, 0)
+
+class CountingProvider(FakeCalendarProvider):
+    # Records how many fetches overlap
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active = 0
+        self.max_active = 0
+
+    async def fetch_changes(self, *args, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            return await super().fetch_changes(*args, **kwargs)
+        finally:
+            self.active -= 1
+
+def _provider(**kwargs) -> CountingProvider:
+    provider = CountingProvider(**kwargs)
+    provider.name = f"fake-sync-{next(_ids)}"
+    return register_provider(provider)
+
+def _user_with_calendars(provider: str, secondaries: int = 1, subject_prefix: str = "[Work]"):
+    # (user id, [(secondary calendar id, external id)]); the access token is valid for the whole test
+    db = SessionLocal()
+    try:
+        alias = f"sync-{next(_ids)}"
+        user = User(name=alias, email=f"{alias}@example.com", password="x", alias=alias, provider=provider,
+                    refresh_token="refresh", access_token="access", token_expiry=datetime.utcnow() + timedelta(days=1))
+        db.add(user)
+        db.flush()
+        db.add(Calendar(user_id=user.id, alias="primary", is_primary=True))
+        calendars = [Calendar(user_id=user.id, alias=f"c{i}", is_primary=False, external_id=f"{alias}-c{i}", subject_prefix=subject_prefix)
+                     for i in range(secondaries)]
+        db.add_all(calendars)
+        db.commit()
+        return user.id, [(calendar.id, calendar.external_id) for calendar in calendars]
+    finally:
+        db.close()
+
+def _mirrored(calendar_id: int):
+    db = SessionLocal()
+    try:
+        return dict(db.query(CalendarEvent.external_id, CalendarEvent.title).filter(CalendarEvent.source_calendar_id == calendar_id))
+    finally:
+        db.close()
+
+def _sync(user_id: int, concurrency: int = 16):
+    async def run():
+        try:
+            return await sync_calendars([user_id], concurrency)
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(run())
+
+def _put(provider, external_id, event_id, title, hour=0):
+    provider.put_event(external_id, event_id, title, START + timedelta(hours=hour), START + timedelta(hours=hour, minutes=30))
+
+def test_delta_sync_fetches_only_changes_and_deletes_cancelled_events():
+    provider = _provider()
+    user_id, [(calendar_id, external_id)] = _user_with_calendars(provider.name)
+    _put(provider, external_id, "a", "Standup")
+    _put(provider, external_id, "b", "Review", 1)
+    assert _sync(user_id) == {calendar_id: 2}
+    assert _mirrored(calendar_id) == {"a": "[Work] Standup", "b": "[Work] Review"}
+
+    _put(provider, external_id, "c", "Retro", 2)
+    provider.cancel_event(external_id, "a")
+    assert _sync(user_id) == {calendar_id: 2}
+    assert _mirrored(calendar_id) == {"b": "[Work] Review", "c": "[Work] Retro"}
+    assert _sync(user_id) == {calendar_id: 0}
+
+def test_paging_follows_cursors():
+    provider = _provider(page_size=2)
+    user_id, [(calendar_id, external_id)] = _user_with_calendars(provider.name, subject_prefix=None)
+    for i in range(5):
+        _put(provider, external_id, f"e{i}", "Private", i)
+    assert _sync(user_id) == {calendar_id: 5}
+    assert provider.requests == 3
+    assert _mirrored(calendar_id) == {f"e{i}": "[Busy]" for i in range(5)}
+
+def test_expired_sync_token_triggers_a_full_resync():
+    provider = _provider()
+    user_id, [(calendar_id, external_id)] = _user_with_calendars(provider.name)
+    _put(provider, external_id, "a", "Standup")
+    _put(provider, external_id, "b", "Review", 1)
+    _sync(user_id)
+    # "a" is deleted and the change log before it forgotten, so the delta cannot carry the cancellation
+    provider.cancel_event(external_id, "a")
+    provider.expire_tokens(external_id)
+    assert _sync(user_id) == {calendar_id: 1}
+    assert _mirrored(calendar_id) == {"b": "[Work] Review"}
+
+def test_resyncing_the_same_events_is_idempotent():
+    provider = _provider()
+    user_id, [(calendar_id, external_id)] = _user_with_calendars(provider.name)
+    _put(provider, external_id, "a", "Standup")
+    _sync(user_id)
+    db = SessionLocal()
+    try:
+        # Forget the sync token: the same events are upserted again, not duplicated
+        db.query(Calendar).filter(Calendar.id == calendar_id).update({Calendar.sync_token: None})
+        db.commit()
+    finally:
+        db.close()
+    _put(provider, external_id, "a", "Standup moved", 3)
+    assert _sync(user_id) == {calendar_id: 1}
+    assert _mirrored(calendar_id) == {"a": "[Work] Standup moved"}
+
+def test_concurrent_fetches_are_bounded():
+    provider = _provider(latency=0.02)
+    user_id, calendars = _user_with_calendars(provider.name, secondaries=6)
+    for calendar_id, external_id in calendars:
+        _put(provider, external_id, "a", "Standup")
+    assert _sync(user_id, concurrency=2) == {calendar_id: 1 for calendar_id, _ in calendars}
+    assert provider.max_active == 2
@@ -0,0 +1,60 @@
+from datetime import datetime, date
+from app.daily_agenda import schedule_daily_agenda, dispatch_due
+from app.models import User, DailyAgendaSchedule, EmailOutbox
+from app.outbox import enqueue_email
+from app.utils import SessionLocal
+
+NOW = datetime(2030, 3, 4, 6, 0)
+
+def _subscribe(db, alias: str) -> User:
+    user = User(name=alias, email=f"{alias}@example.com", password="x", alias=alias,
+                send_daily_agenda=True, agenda_send_time="08:00", timezone="Europe/Paris")
+    db.add(user)
+    db.flush()
+    schedule_daily_agenda(db, user, NOW)
+    db.commit()
+    return user
+
+def _dispatch(db, now: datetime):
+    # Other tests share the database and may have agendas due too, so drain every batch and let
+    # each test check its own schedule row instead of the count
+    while dispatch_due(db, now):
+        pass
+
+def _queued(db, user: User, day: date):
+    return db.query(EmailOutbox.id).filter(EmailOutbox.idempotency_key == f"daily-agenda:{user.id}:{day.isoformat()}").count()
+
+def test_unsubscribing_keeps_the_last_sent_date():
+    db = SessionLocal()
+    try:
+        user = _subscribe(db, "agenda-resubscribe")
+        _dispatch(db, datetime(2030, 3, 4, 7, 1))
+        assert _queued(db, user, date(2030, 3, 4)) == 1
+        user.send_daily_agenda = False
+        schedule_daily_agenda(db, user, datetime(2030, 3, 4, 7, 2))
+        db.commit()
+        row = db.get(DailyAgendaSchedule, user.id)
+        assert row.disabled_at is not None and row.last_sent_date == date(2030, 3, 4)
+        _dispatch(db, datetime(2030, 3, 5, 7, 1))
+        assert _queued(db, user, date(2030, 3, 5)) == 0
+
+        # Resubscribing before the same send time must not send that day's agenda again
+        user.send_daily_agenda = True
+        schedule_daily_agenda(db, user, datetime(2030, 3, 4, 7, 3))
+        db.commit()
+        assert row.disabled_at is None and row.local_date == date(2030, 3, 5)
+    finally:
+        db.close()
+
+def test_already_queued_agenda_is_skipped():
+    db = SessionLocal()
+    try:
+        user = _subscribe(db, "agenda-duplicate")
+        key = f"daily-agenda:{user.id}:2030-03-04"
+        enqueue_email(db, user.email, "Your Daily Agenda", "queued by another dispatcher", key)
+        db.commit()
+        _dispatch(db, datetime(2030, 3, 4, 7, 1))
+        assert db.query(EmailOutbox.body).filter(EmailOutbox.idempotency_key == key).all() == [("queued by another dispatcher",)]
+        assert db.get(DailyAgendaSchedule, user.id).local_date == date(2030, 3, 5)
+    finally:
+        db.close()
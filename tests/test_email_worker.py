@@ -0,0 +1,123 @@
+from datetime import datetime
+from email.mime.text import MIMEText
+import email
+import socketserver
+import threading
+import pytest
+from app.email_worker import SMTPConnection, drain_once
+from app.models import EmailOutbox
+from app.outbox import enqueue_email
+from app.utils import SessionLocal
+
+class FakeSMTP:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        if msg["To"] == "broken@example.com":
+            raise ValueError("cannot encode")
+        self.sent.append(msg["To"])
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib; hangs up after every `drop_after` messages
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 stub")
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command.startswith("DATA"):
+                self.reply("354 end with .")
+                data = []
+                while (part := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(part)
+                self.server.messages.append(email.message_from_bytes(b"".join(data)))
+                self.reply("250 queued")
+                if self.server.drop_after and len(self.server.messages) % self.server.drop_after == 0:
+                    return
+            elif command.startswith("QUIT"):
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), StubSMTPHandler)
+    server.daemon_threads = True
+    server.connections, server.messages, server.drop_after = 0, [], None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _message(to: str):
+    msg = MIMEText("body")
+    msg["Subject"], msg["From"], msg["To"] = "subject", "noreply@example.com", to
+    return msg
+
+def test_one_failing_message_does_not_stop_the_batch():
+    db = SessionLocal()
+    try:
+        keys = [f"worker-{name}" for name in ("first", "broken", "last")]
+        for key in keys:
+            enqueue_email(db, f"{key.split('-')[1]}@example.com", "subject", "body", key)
+        db.commit()
+        smtp = FakeSMTP()
+        while drain_once(db, smtp, "test-worker"):
+            pass
+        # Other tests queue emails too
+        assert [to for to in smtp.sent if to in ("first@example.com", "last@example.com")] == ["first@example.com", "last@example.com"]
+        rows = dict(db.query(EmailOutbox.idempotency_key, EmailOutbox.status).filter(EmailOutbox.idempotency_key.in_(keys)))
+        assert rows == {"worker-first": "sent", "worker-broken": "pending", "worker-last": "sent"}
+        broken = db.query(EmailOutbox).filter(EmailOutbox.idempotency_key == "worker-broken").one()
+        assert broken.attempts == 1 and broken.locked_by is None and broken.next_attempt_at > datetime.utcnow()
+    finally:
+        db.close()
+
+def test_smtp_connection_is_reused_and_reconnects(smtp_server):
+    smtp = SMTPConnection(*smtp_server.server_address, timeout=5)
+    try:
+        for i in range(3):
+            smtp.send(_message(f"reuse{i}@example.com"))
+        assert smtp_server.connections == 1
+        # The server hangs up after the next message: the one after it goes out on a new connection
+        smtp_server.drop_after = 4
+        for i in range(3, 5):
+            smtp.send(_message(f"reuse{i}@example.com"))
+    finally:
+        smtp.close()
+    assert [msg["To"] for msg in smtp_server.messages] == [f"reuse{i}@example.com" for i in range(5)]
+    assert smtp_server.connections == 2
+
+class WorkerKilled(BaseException):
+    pass
+
+def test_messages_sent_before_the_worker_dies_stay_sent():
+    class DyingSMTP(FakeSMTP):
+        def send(self, msg):
+            if msg["To"] == "second@killed.example.com":
+                raise WorkerKilled()
+            super().send(msg)
+
+    db = SessionLocal()
+    try:
+        keys = ["killed-first", "killed-second"]
+        for key in keys:
+            enqueue_email(db, f"{key.split('-')[1]}@killed.example.com", "subject", "body", key)
+        db.commit()
+        with pytest.raises(WorkerKilled):
+            while drain_once(db, DyingSMTP(), "dying-worker"):
+                pass
+        db.rollback()
+    finally:
+        db.close()
+    db = SessionLocal()
+    try:
+        rows = dict(db.query(EmailOutbox.idempotency_key, EmailOutbox.status).filter(EmailOutbox.idempotency_key.in_(keys)))
+        # The second message stays leased and is retried once the lease expires; the first is not sent twice
+        assert rows == {"killed-first": "sent", "killed-second": "sending"}
+    finally:
+        db.close()
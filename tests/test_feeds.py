@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app.models import User, Calendar, Agenda
+from app.utils import SessionLocal, create_access_token
+import main
+
+client = TestClient(main.app)
+
+def test_user_feed_etag_changes_with_every_booking():
+    db = SessionLocal()
+    try:
+        user = User(name="feed", email="feed@example.com", password="x", alias="feed")
+        db.add(user)
+        db.flush()
+        calendar = Calendar(user_id=user.id, alias="primary", is_primary=True)
+        db.add(calendar)
+        db.flush()
+        db.add(Agenda(user_id=user.id, calendar_id=calendar.id, slot_duration=30, alias_name="feed-agenda"))
+        db.commit()
+        user_id = user.id
+    finally:
+        db.close()
+    token = client.get("/feeds/token", headers={"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}).json()["token"]
+    etags = [client.get("/feeds/user.ics", params={"token": token}).headers["etag"]]
+    start = (datetime.utcnow() + timedelta(days=3)).replace(hour=10, minute=0, second=0, microsecond=0)
+    for visitor in range(2):
+        slot = start + timedelta(hours=visitor)
+        booked = client.post("/agendas/public/feed-agenda/book", json={
+            "agenda_id": 0, "start_time": slot.isoformat(), "end_time": (slot + timedelta(minutes=30)).isoformat(),
+            "booked_by_email": f"visitor{visitor}@example.com", "meeting_type": "virtual",
+        })
+        assert booked.status_code == 200, booked.text
+        response = client.get("/feeds/user.ics", params={"token": token}, headers={"If-None-Match": etags[-1]})
+        assert response.status_code == 200 and f"visitor{visitor}@example.com" in response.text
+        etags.append(response.headers["etag"])
+    assert len(set(etags)) == 3
+    assert client.get("/feeds/user.ics", params={"token": token}, headers={"If-None-Match": etags[-1]}).status_code == 304
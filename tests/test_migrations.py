@@ -0,0 +1,44 @@
+from sqlalchemy import select, text
+from app.database import create_db_engine
+from app.migrations import run_migrations
+from app.models import AvailabilitySlot, Calendar, Agenda, Meeting, TeamMember
+from app.models.user import Base
+from datetime import datetime
+
+HOT_PATH_INDEXES = (
+    "ix_meetings_agenda_id_start_time_end_time",
+    "ix_availability_slots_user_id_day_of_week",
+    "ix_calendars_user_id_is_primary",
+    "ix_agendas_user_id",
+    "ix_team_members_team_id",
+)
+
+def _plan(conn, statement) -> str:
+    sql = statement.compile(conn, compile_kwargs={"literal_binds": True})
+    return " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+def test_hot_queries_use_migrated_indexes(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path}/plan.db")
+    Base.metadata.create_all(bind=engine)
+    # Start from a database created before the indexes existed
+    with engine.begin() as conn:
+        for name in HOT_PATH_INDEXES:
+            conn.execute(text(f"DROP INDEX {name}"))
+    assert 1 in run_migrations(engine)
+
+    start, end = datetime(2026, 1, 5, 9), datetime(2026, 1, 12, 9)
+    queries = {
+        "USING COVERING INDEX ix_meetings_agenda_id_start_time_end_time": select(Meeting.start_time, Meeting.end_time).where(
+            Meeting.agenda_id == 1, Meeting.start_time < end, Meeting.end_time > start
+        ),
+        "ix_availability_slots_user_id_day_of_week": select(
+            AvailabilitySlot.day_of_week, AvailabilitySlot.start_time, AvailabilitySlot.end_time
+        ).where(AvailabilitySlot.user_id == 1),
+        "ix_calendars_user_id_is_primary": select(Calendar.id).where(Calendar.user_id == 1, Calendar.is_primary == True),
+        "ix_agendas_user_id": select(Agenda.id, Agenda.alias_name).where(Agenda.user_id == 1),
+        "ix_team_members_team_id": select(TeamMember.email).where(TeamMember.team_id == 1),
+    }
+    with engine.connect() as conn:
+        for expected, statement in queries.items():
+            plan = _plan(conn, statement)
+            assert "SEARCH" in plan and expected in plan, plan
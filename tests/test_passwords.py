@@ -0,0 +1,26 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.utils import password_hash_stats, verify_password
+import main
+
+client = TestClient(main.app)
+
+def test_register_and_login_through_the_hashing_pool():
+    before = dict(password_hash_stats)
+    user = {"name": "hashing", "email": "hashing@example.com", "password": "s3cret-pass", "alias": "hashing"}
+    assert client.post("/users/register", json=user).status_code == 200
+    assert client.post("/users/login", json={"email": user["email"], "password": user["password"]}).status_code == 200
+    assert client.post("/users/login", json={"email": user["email"], "password": "wrong"}).status_code == 400
+    # A wrong password is a completed verification, not a failed job
+    assert password_hash_stats["completed"] == before["completed"] + 3
+    assert password_hash_stats["failed"] == before["failed"]
+    assert password_hash_stats["in_flight"] == 0
+
+def test_failed_jobs_are_not_counted_as_completed():
+    before = dict(password_hash_stats)
+    with pytest.raises(ValueError):
+        asyncio.run(verify_password("password", "not-a-bcrypt-hash"))
+    assert password_hash_stats["failed"] == before["failed"] + 1
+    assert password_hash_stats["completed"] == before["completed"]
+    assert password_hash_stats["in_flight"] == 0
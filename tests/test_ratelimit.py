@@ -0,0 +1,53 @@
+import asyncio
+import sqlite3
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.metrics import http_requests_total
+from app.middleware import MetricsMiddleware, RateLimitMiddleware
+from app.ratelimit import MemoryBackend, SQLiteBackend, RateLimiter, RateRule, parse_rules
+
+def _limiter(backend):
+    # Login is limited to 5 per minute on top of a default of 2 per second
+    return RateLimiter(backend, RateRule("default", None, None, 2, 1), parse_rules("POST /users/login 5/60"))
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    return MemoryBackend() if request.param == "memory" else SQLiteBackend(str(tmp_path / "ratelimit.db"))
+
+def test_rejected_request_takes_no_tokens(backend, monkeypatch):
+    limiter = _limiter(backend)
+    monkeypatch.setattr("time.time", lambda: 1000.0)
+    assert limiter.check("1.2.3.4", "POST", "/users/login") is None
+    assert limiter.check("1.2.3.4", "POST", "/users/login") is None
+    # The default rule rejects the third request in the same second; the login bucket must keep its tokens
+    assert limiter.check("1.2.3.4", "POST", "/users/login").name == "default"
+    for second in range(1, 4):
+        monkeypatch.setattr("time.time", lambda: 1000.0 + second)
+        assert limiter.check("1.2.3.4", "POST", "/users/login") is None
+    assert limiter.check("1.2.3.4", "POST", "/users/login").name == "POST /users/login"
+
+def test_locked_sqlite_backend_fails_open(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    limiter = _limiter(SQLiteBackend(path, timeout=0.01))
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        assert asyncio.run(limiter.check_async("1.2.3.4", "GET", "/")) is None
+        assert limiter.backend.failures == 1
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+    assert asyncio.run(limiter.check_async("1.2.3.4", "GET", "/")) is None
+
+def test_rejections_pass_through_metrics_middleware():
+    app = FastAPI()
+    app.get("/limited")(lambda: {"ok": True})
+    app.add_middleware(RateLimitMiddleware, limiter=RateLimiter(MemoryBackend(), RateRule("default", None, None, 1, 60), []))
+    app.add_middleware(MetricsMiddleware)
+    client = TestClient(app)
+    rejected_before = http_requests_total._values.get(("GET", "<unmatched>", "429"), 0)
+    assert client.get("/limited").status_code == 200
+    response = client.get("/limited")
+    assert response.status_code == 429 and response.json() == {"detail": "Rate limit exceeded"}
+    assert http_requests_total._values[("GET", "<unmatched>", "429")] == rejected_before + 1
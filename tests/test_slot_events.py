@@ -0,0 +1,89 @@
+import asyncio
+import json
+import sqlite3
+import time
+import httpx
+from datetime import datetime, timedelta
+from app.async_db import async_engine
+from app.models import User, Calendar, Agenda
+from app.slot_events import RESYNC, SLOT_TAKEN, MemoryBroker, SQLiteBroker, SlotEventHub, slot_events, sse_stream
+from app.utils import SessionLocal
+import main
+
+def _create_agenda(alias_name: str):
+    db = SessionLocal()
+    try:
+        user = User(name=alias_name, email=f"{alias_name}@example.com", password="x", alias=alias_name)
+        db.add(user)
+        db.flush()
+        calendar = Calendar(user_id=user.id, alias="primary", is_primary=True)
+        db.add(calendar)
+        db.flush()
+        agenda = Agenda(user_id=user.id, calendar_id=calendar.id, slot_duration=30, alias_name=alias_name)
+        db.add(agenda)
+        db.commit()
+        return agenda.id
+    finally:
+        db.close()
+
+def test_sqlite_publish_does_not_wait_for_a_locked_database(tmp_path):
+    path = str(tmp_path / "slot_events.db")
+    hub = SlotEventHub(SQLiteBroker(path, poll_seconds=0.01))
+    start = datetime(2030, 1, 7, 9, 0)
+
+    async def run():
+        queue = hub.subscribe("agenda")
+        holder = sqlite3.connect(path, isolation_level=None)
+        holder.execute("BEGIN IMMEDIATE")
+        try:
+            started = time.perf_counter()
+            hub.publish("agenda", SLOT_TAKEN, start, start + timedelta(minutes=30))
+            assert time.perf_counter() - started < 0.05
+        finally:
+            holder.execute("ROLLBACK")
+            holder.close()
+        return await asyncio.wait_for(queue.get(), 5)
+
+    assert asyncio.run(run()) == {"type": SLOT_TAKEN, "start_time": start.isoformat(), "end_time": "2030-01-07T09:30:00"}
+
+def test_booking_through_the_app_reaches_event_subscribers():
+    agenda_id = _create_agenda("events-booking")
+    start = (datetime.utcnow() + timedelta(days=2)).replace(hour=10, minute=0, second=0, microsecond=0)
+    body = {"agenda_id": agenda_id, "start_time": start.isoformat(), "end_time": (start + timedelta(minutes=30)).isoformat(),
+            "booked_by_email": "visitor@example.com", "meeting_type": "virtual"}
+
+    async def run():
+        stream = sse_stream("events-booking")
+        try:
+            # The first chunk is sent once the stream has subscribed to the hub
+            assert await stream.__anext__() == ": subscribed\n\n"
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                assert (await client.get("/agendas/public/events-missing/events")).status_code == 404
+                assert (await client.post("/agendas/public/events-booking/book", json=body)).status_code == 200
+            return await asyncio.wait_for(stream.__anext__(), 5)
+        finally:
+            await stream.aclose()
+            await async_engine.dispose()
+
+    event, data = asyncio.run(run()).strip().split("\n")
+    assert event == f"event: {SLOT_TAKEN}"
+    assert json.loads(data.removeprefix("data: ")) == {"type": SLOT_TAKEN, "start_time": body["start_time"], "end_time": body["end_time"]}
+    assert slot_events.subscriber_count() == 0
+
+def test_overfilled_queue_collapses_to_one_resync():
+    hub = SlotEventHub(MemoryBroker(), queue_size=4)
+    start = datetime(2030, 1, 7, 9, 0)
+
+    async def run():
+        queue = hub.subscribe("agenda")
+        for i in range(12):
+            hub.publish("agenda", SLOT_TAKEN, start + timedelta(hours=i), start + timedelta(hours=i, minutes=30))
+        await asyncio.sleep(0.01)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    messages = asyncio.run(run())
+    # Messages 5 and 9 overflow: each time the backlog is dropped and one resync takes its place,
+    # and the deltas published after the last overflow follow it
+    assert [message["type"] for message in messages] == [RESYNC, SLOT_TAKEN, SLOT_TAKEN, SLOT_TAKEN]
+    assert [message["start_time"] for message in messages[1:]] == [(start + timedelta(hours=i)).isoformat() for i in (9, 10, 11)]
+    assert hub.dropped == 9
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+import pytz
+from fastapi.testclient import TestClient
+from app.models import User, Team, TeamMember
+from app.utils import SessionLocal, create_access_token
+from app.slots import DEFAULT_AVAILABILITY_MASK, MAX_HORIZON_DAYS, common_free_slots
+import main
+
+def test_common_free_slots_cover_the_longest_horizon():
+    # Longer than the 35 days of buckets that fit in one week of minutes, where week bitsets wrap
+    range_start = datetime(2030, 1, 7)
+    range_end = range_start + timedelta(days=MAX_HORIZON_DAYS)
+    busy = [(range_start + timedelta(days=40, hours=9), range_start + timedelta(days=40, hours=10))]
+    members = [(DEFAULT_AVAILABILITY_MASK, pytz.utc, []), (DEFAULT_AVAILABILITY_MASK, pytz.utc, busy)]
+    slots = common_free_slots(members, range_start, range_end, 8 * 60, 100)
+    starts = [slot["start_time"] for slot in slots]
+    assert len(starts) == MAX_HORIZON_DAYS - 1
+    assert starts[-1] == range_start + timedelta(days=MAX_HORIZON_DAYS - 1, hours=9)
+    assert range_start + timedelta(days=40, hours=9) not in starts
+
+def test_common_free_slots_of_an_empty_range():
+    range_start = datetime(2030, 1, 7)
+    members = [(DEFAULT_AVAILABILITY_MASK, pytz.utc, [])]
+    assert common_free_slots(members, range_start, range_start - timedelta(days=1), 30, 10) == []
+
+def test_team_free_slots_from_a_past_start_date():
+    db = SessionLocal()
+    try:
+        owner = User(name="team-owner", email="team-owner@example.com", password="x", alias="team-owner")
+        db.add(owner)
+        db.flush()
+        team = Team(user_id=owner.id, name="team")
+        db.add(team)
+        db.flush()
+        db.add(TeamMember(team_id=team.id, email=owner.email))
+        db.commit()
+        owner_id, team_id = owner.id, team.id
+    finally:
+        db.close()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(owner_id)})}"}
+    start = (datetime.utcnow() - timedelta(days=10)).date()
+    response = TestClient(main.app).get(f"/teams/{team_id}/free-slots", params={"start": str(start), "days": 3}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()
+    assert all(slot["start_time"] >= datetime.utcnow().isoformat() for slot in response.json())
@@ -0,0 +1,81 @@
+import asyncio
+import httpx
+from datetime import datetime, timedelta
+from app.async_db import async_engine
+from app.models import User, Calendar, Agenda, Meeting, Team, TeamMember
+from app.utils import SessionLocal, create_access_token
+import main
+
+START = datetime(2031, 2, 3, 9, 0)
+
+def _members(*aliases):
+    db = SessionLocal()
+    try:
+        db.add_all(User(name=alias, email=f"{alias}@example.com", password="x", alias=alias) for alias in aliases)
+        db.commit()
+        return [f"{alias}@example.com" for alias in aliases]
+    finally:
+        db.close()
+
+def _organiser(alias: str, emails):
+    # (organiser id, agenda id, team id)
+    db = SessionLocal()
+    try:
+        user = User(name=alias, email=f"{alias}@example.com", password="x", alias=alias)
+        db.add(user)
+        db.flush()
+        calendar = Calendar(user_id=user.id, alias="primary", is_primary=True)
+        db.add(calendar)
+        db.flush()
+        agenda = Agenda(user_id=user.id, calendar_id=calendar.id, slot_duration=30, alias_name=alias)
+        team = Team(user_id=user.id, name=alias)
+        db.add_all([agenda, team])
+        db.flush()
+        db.add_all(TeamMember(team_id=team.id, email=email) for email in emails)
+        db.commit()
+        return user.id, agenda.id, team.id
+    finally:
+        db.close()
+
+def _body(agenda_id: int, start: datetime = START):
+    return {"agenda_id": agenda_id, "start_time": start.isoformat(), "end_time": (start + timedelta(minutes=30)).isoformat(),
+            "booked_by_email": "organiser@example.com", "meeting_type": "virtual"}
+
+def _post(requests):
+    # requests: [(organiser id, team id, body)], sent concurrently
+    async def run():
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                return await asyncio.gather(*(
+                    client.post("/teams/meetings", params={"team_id": team_id}, json=body,
+                                headers={"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"})
+                    for user_id, team_id, body in requests
+                ))
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(run())
+
+def test_concurrent_team_meetings_do_not_double_book_a_member():
+    # Two organisers share a member and race for the same half hour
+    shared, x, y = _members("team-race-shared", "team-race-x", "team-race-y")
+    first = _organiser("team-race-a", [shared, x])
+    second = _organiser("team-race-b", [shared, y])
+    responses = _post([(user_id, team_id, _body(agenda_id)) for user_id, agenda_id, team_id in (first, second)] * 4)
+    assert sorted(response.status_code for response in responses) == [200] + [400] * 7
+    db = SessionLocal()
+    try:
+        booked = db.query(Meeting.id).filter(Meeting.booked_by_email == shared, Meeting.start_time == START).count()
+        assert booked == 1
+    finally:
+        db.close()
+
+def test_team_meeting_on_someone_elses_agenda_is_rejected():
+    user_id, _, team_id = _organiser("team-owner-a", _members("team-owner-member"))
+    _, other_agenda_id, _ = _organiser("team-owner-b", [])
+    [response] = _post([(user_id, team_id, _body(other_agenda_id))])
+    assert response.status_code == 404
+    db = SessionLocal()
+    try:
+        assert db.query(Meeting).filter(Meeting.agenda_id == other_agenda_id).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,119 @@
+import asyncio
+import itertools
+from datetime import datetime, timedelta
+from app.async_db import async_engine
+from app.models import User
+from app.tokens import FakeTokenEndpoint, RefreshFailed, TokenManager, register_token_endpoint
+from app.utils import SessionLocal
+
+_ids = itertools.count()
+
+def _endpoint(**kwargs) -> FakeTokenEndpoint:
+    # A fake endpoint of its own per test, registered under a unique provider name
+    endpoint = FakeTokenEndpoint(**kwargs)
+    endpoint.name = f"fake-{next(_ids)}"
+    return register_token_endpoint(endpoint)
+
+def _connected_user(provider: str, refresh_token: str, expires_in: float = None) -> int:
+    db = SessionLocal()
+    try:
+        alias = f"oauth-{next(_ids)}"
+        user = User(
+            name=alias, email=f"{alias}@example.com", password="x", alias=alias, provider=provider,
+            refresh_token=refresh_token, access_token="stored-access",
+            token_expiry=datetime.utcnow() + timedelta(seconds=expires_in) if expires_in is not None else None,
+        )
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def _stored(user_id: int):
+    db = SessionLocal()
+    try:
+        return db.query(User.refresh_token, User.access_token, User.token_expiry).filter(User.id == user_id).one()
+    finally:
+        db.close()
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+async def _until(condition, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_run_refreshes_ahead_of_expiry_and_reschedules():
+    # Each new token is due again 0.3 s after it is issued, so the loop must pick up its own heap entries
+    endpoint = _endpoint(lifetime=300.3)
+    user_id = _connected_user(endpoint.name, "refresh", expires_in=200)
+    manager = TokenManager(refresh_ahead=300)
+
+    async def scenario():
+        manager.seed(user_id, endpoint.name, "stored-access", datetime.utcnow() + timedelta(seconds=200))
+        task = asyncio.create_task(manager.run())
+        try:
+            await _until(lambda: manager.refreshes == 1)
+            first = manager._tokens[user_id]
+            assert first.access_token == "fake-access-1"
+            # Proactive: the cached token is returned without another call while it is being refreshed ahead
+            assert await manager.get_token(user_id) == "fake-access-1"
+            await _until(lambda: manager.refreshes == 2)
+            assert manager._tokens[user_id].expires_at > first.expires_at
+            assert (manager._tokens[user_id].expires_at, user_id) in manager._expiries
+        finally:
+            task.cancel()
+        # Stale heap entries for replaced tokens never cause an extra refresh
+        assert endpoint.calls == manager.refreshes
+
+    _run(scenario())
+    refresh_token, access_token, _ = _stored(user_id)
+    assert refresh_token == "refresh" and access_token.startswith("fake-access-")
+
+def test_concurrent_callers_share_one_refresh():
+    endpoint = _endpoint(latency=0.05)
+    user_id = _connected_user(endpoint.name, "refresh")
+    manager = TokenManager()
+
+    async def scenario():
+        return await asyncio.gather(*(manager.get_token(user_id) for _ in range(20)))
+
+    assert _run(scenario()) == ["fake-access-1"] * 20
+    assert endpoint.calls == 1
+
+def test_revoked_refresh_token_needs_reauth_and_run_keeps_going():
+    endpoint = _endpoint()
+    endpoint.revoked.add("revoked")
+    revoked_id = _connected_user(endpoint.name, "revoked", expires_in=10)
+    healthy_id = _connected_user(endpoint.name, "healthy", expires_in=20)
+    manager = TokenManager(refresh_ahead=300)
+
+    async def scenario():
+        manager.seed(revoked_id, endpoint.name, "stored-access", datetime.utcnow() + timedelta(seconds=10))
+        task = asyncio.create_task(manager.run())
+        try:
+            await _until(lambda: endpoint.calls == 1)
+            # Seeded after the failure: the loop must still be alive to refresh it
+            manager.seed(healthy_id, endpoint.name, "stored-access", datetime.utcnow() + timedelta(seconds=20))
+            await _until(lambda: manager.refreshes == 1)
+            assert not task.done()
+            try:
+                await manager.get_token(revoked_id)
+            except RefreshFailed:
+                pass
+            else:
+                raise AssertionError("a revoked user must not get a token")
+        finally:
+            task.cancel()
+        assert revoked_id not in manager._tokens
+
+    _run(scenario())
+    assert _stored(revoked_id) == (None, None, None)
+    assert _stored(healthy_id).refresh_token == "healthy"
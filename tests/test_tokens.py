@@ -0,0 +1,56 @@
+import asyncio
+from fastapi.testclient import TestClient
+from jose import jwt
+from app.models import User
+from app.utils import SECRET_KEY, ALGORITHM, SessionLocal, create_access_token, create_feed_token, create_password_reset_token, verify_password
+import main
+
+client = TestClient(main.app)
+
+def _create_user(alias: str) -> int:
+    db = SessionLocal()
+    try:
+        user = User(name=alias, email=f"{alias}@example.com", password="x", alias=alias)
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def _bearer(token: str):
+    return {"Authorization": f"Bearer {token}"}
+
+def test_feed_token_is_not_an_access_token():
+    user_id = _create_user("feed-owner")
+    feed_token = client.get("/feeds/token", headers=_bearer(create_access_token({"sub": str(user_id)}))).json()["token"]
+    assert client.get("/feeds/token", headers=_bearer(feed_token)).status_code == 401
+    # Not even with the same claims: feed tokens are signed with their own key
+    assert client.get("/feeds/token", headers=_bearer(create_feed_token(user_id, 0))).status_code == 401
+
+def test_rotating_the_feed_token_revokes_old_urls():
+    user_id = _create_user("feed-rotate")
+    headers = _bearer(create_access_token({"sub": str(user_id)}))
+    old_token = client.get("/feeds/token", headers=headers).json()["token"]
+    assert client.get("/feeds/user.ics", params={"token": old_token}).status_code == 200
+
+    new_token = client.post("/feeds/token/rotate", headers=headers).json()["token"]
+    assert client.get("/feeds/user.ics", params={"token": old_token}).status_code == 404
+    assert client.get("/feeds/user.ics", params={"token": new_token}).status_code == 200
+
+def test_password_reset_token_round_trip():
+    user_id = _create_user("reset-owner")
+    token = create_password_reset_token(user_id)
+    assert client.get("/feeds/token", headers=_bearer(token)).status_code == 401
+    response = client.post("/users/password-reset", json={"token": token, "new_password": "n3w-passw0rd"})
+    assert response.status_code == 200
+    db = SessionLocal()
+    try:
+        assert asyncio.run(verify_password("n3w-passw0rd", db.get(User, user_id).password))
+    finally:
+        db.close()
+
+def test_access_token_with_a_non_numeric_subject_is_unauthorized():
+    for claims in ({"sub": "admin"}, {"sub": None}, {}):
+        token = jwt.encode({**claims, "type": "access"}, SECRET_KEY, algorithm=ALGORITHM)
+        assert client.get("/feeds/token", headers=_bearer(token)).status_code == 401
+        assert client.get("/users/me", headers=_bearer(token)).status_code == 401